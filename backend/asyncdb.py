@@ -0,0 +1,58 @@
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+
+class DBExecutor:
+    """Runs blocking SQLAlchemy work on dedicated threads.
+
+    With SQLite there should be a single thread, as there is only ever
+    one writer anyway. Only the calling coroutine waits for the result,
+    the event loop keeps serving all other connections meanwhile.
+    """
+
+    def __init__(self, max_workers=1):
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="quiz-db"
+        )
+
+    async def run(self, fn, *args, **kwargs):
+        loop = asyncio.get_event_loop()
+        # keep context variables (e.g. the current message) visible in the thread
+        call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+        return await loop.run_in_executor(self._pool, call)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
+
+
+class DBSession:
+    """Awaitable front for SQLAlchemy sessions.
+
+    `run(fn, *args)` calls `fn(session, *args)` on the executor with a
+    new session of `session_factory`, a unit of work that ends with the
+    call: it is rolled back if `fn` raises and closed in any case. So
+    nothing outlives a call, neither a pooled connection nor the objects
+    of the identity map, and a failed call leaves nothing behind for the
+    next one. `fn` must commit its changes and return plain data, no ORM
+    objects.
+    """
+
+    def __init__(self, session_factory, executor: DBExecutor):
+        self.session_factory = session_factory
+        self.executor = executor
+
+    def _call(self, fn, *args, **kwargs):
+        session = self.session_factory()
+        try:
+            return fn(session, *args, **kwargs)
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    async def run(self, fn, *args, **kwargs):
+        return await self.executor.run(self._call, fn, *args, **kwargs)
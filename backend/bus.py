@@ -0,0 +1,135 @@
+import asyncio
+import json
+import logging
+import struct
+from uuid import uuid4
+
+LOG = logging.getLogger("quiz.bus")
+
+# Every frame on the Unix socket: payload length, sequence number, payload.
+# Workers send 0 as sequence number, the broker numbers all frames and
+# forwards them to every worker, the sender included.
+HEADER = struct.Struct("!IQ")
+
+
+class LocalBus:
+    """The bus of a single server process, events are delivered right away.
+
+    `handler(event, seq)` is called for every published event; seq is None
+    as the process numbers its events itself.
+    """
+
+    epoch = None
+    lost = False
+
+    def __init__(self):
+        self.handler = None
+        self.on_lost = None
+
+    async def start(self, handler):
+        self.handler = handler
+
+    async def publish(self, event):
+        self.handler(event, None)
+
+    async def stop(self):
+        pass
+
+
+class UnixBus:
+    """Connects a worker to the broker of its server (see `Broker`).
+
+    Events are JSON serialisable dicts. They reach `handler(event, seq)` in
+    the same order in all workers, the publishing one included, with the
+    sequence number assigned by the broker.
+
+    Without the broker the worker would miss the events of all others, so
+    `on_lost()` is called when the connection is lost and `publish` raises
+    from then on. The worker is expected to exit.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.epoch = None
+        self.handler = None
+        self.on_lost = None
+        self.lost = False
+        self._writer = None
+        self._reader_task = None
+
+    async def start(self, handler):
+        self.handler = handler
+        reader, self._writer = await asyncio.open_unix_connection(self.path)
+        # the broker greets with its epoch
+        header = await reader.readexactly(HEADER.size)
+        length, _ = HEADER.unpack(header)
+        self.epoch = (await reader.readexactly(length)).decode()
+        self._reader_task = asyncio.ensure_future(self._read(reader))
+
+    async def _read(self, reader):
+        try:
+            while True:
+                length, seq = HEADER.unpack(await reader.readexactly(HEADER.size))
+                event = json.loads(await reader.readexactly(length))
+                try:
+                    self.handler(event, seq)
+                except Exception:
+                    LOG.exception("Could not handle event %s", seq)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            LOG.error("Lost the connection to the broker.")
+        self.lost = True
+        if self.on_lost is not None:
+            self.on_lost()
+
+    async def publish(self, event):
+        if self.lost:
+            raise ConnectionError("Lost the connection to the broker.")
+        data = json.dumps(event).encode()
+        self._writer.write(HEADER.pack(len(data), 0) + data)
+        await self._writer.drain()
+
+    async def stop(self):
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+
+
+class Broker:
+    """Numbers the frames of all workers and sends them to every worker.
+
+    Runs in the supervising process. It never decodes the payloads.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.epoch = uuid4().hex
+        self.seq = 0
+        self._workers = set()
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_unix_server(self._handle, self.path)
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        epoch = self.epoch.encode()
+        writer.write(HEADER.pack(len(epoch), 0) + epoch)
+        self._workers.add(writer)
+        try:
+            while True:
+                header = await reader.readexactly(HEADER.size)
+                length, _ = HEADER.unpack(header)
+                data = await reader.readexactly(length)
+                self.seq += 1
+                frame = HEADER.pack(length, self.seq) + data
+                for worker in self._workers:
+                    worker.write(frame)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._workers.discard(writer)
+            writer.close()
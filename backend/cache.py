@@ -0,0 +1,366 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from uuid import UUID
+
+from sqlalchemy.exc import IntegrityError
+
+import statements
+from db import Player, PlayerInGame, Team
+from statements import execute
+
+
+def as_uuid(value) -> UUID:
+    if isinstance(value, UUID):
+        return value
+    return UUID(str(value))
+
+
+@dataclass
+class CachedPlayer:
+    id: int
+    uuid: UUID
+    name: str
+    color: str
+
+
+@dataclass
+class CachedTeam:
+    id: int
+    game_id: int
+    team_code: str
+    name: str
+    quizadmin: bool
+    # PlayerInGame ids in the order they joined
+    member_ids: List[int] = field(default_factory=list)
+
+
+@dataclass
+class CachedPlayerInGame:
+    id: int
+    player_uuid: UUID
+    game_uuid: UUID
+    team_id: Optional[int] = None
+
+
+@dataclass
+class CachedGame:
+    id: int
+    uuid: UUID
+    name: str
+    num_questions: int
+    # see Game.questions_ordered
+    question_order: List[str] = field(default_factory=list)
+    teams: Dict[int, CachedTeam] = field(default_factory=dict)
+    team_codes: Dict[str, int] = field(default_factory=dict)
+    players: Dict[UUID, CachedPlayerInGame] = field(default_factory=dict)
+    players_by_id: Dict[int, CachedPlayerInGame] = field(default_factory=dict)
+
+    def add_team(self, team: CachedTeam):
+        self.teams[team.id] = team
+        self.team_codes[team.team_code] = team.id
+
+    def add_player(self, pig: CachedPlayerInGame):
+        self.players[pig.player_uuid] = pig
+        self.players_by_id[pig.id] = pig
+        if pig.team_id in self.teams:
+            members = self.teams[pig.team_id].member_ids
+            if pig.id not in members:
+                members.append(pig.id)
+
+    def merge_team(self, record: CachedTeam) -> CachedTeam:
+        # Add a team row that was just read, or update the cached one
+        cached = self.teams.get(record.id)
+        if cached is None:
+            self.add_team(record)
+            return record
+        cached.name = record.name
+        cached.quizadmin = record.quizadmin
+        return cached
+
+    def move_player(self, pig: CachedPlayerInGame, team_id):
+        old_team = self.teams.get(pig.team_id)
+        if old_team is not None and pig.id in old_team.member_ids:
+            old_team.member_ids.remove(pig.id)
+        pig.team_id = team_id
+        members = self.teams[team_id].member_ids
+        if pig.id not in members:
+            members.append(pig.id)
+
+
+def roster_change(pig: CachedPlayerInGame, team: Optional[CachedTeam] = None):
+    # A PlayerInGame that was added or moved, for `StateCache.apply_roster`
+    change = {
+        "pig_id": pig.id,
+        "player_uuid": str(pig.player_uuid),
+        "team_id": pig.team_id,
+    }
+    if team is not None:
+        change["team"] = {
+            "id": team.id,
+            "game_id": team.game_id,
+            "team_code": team.team_code,
+            "name": team.name,
+            "quizadmin": team.quizadmin,
+        }
+    return change
+
+
+def player_record(player: Player) -> CachedPlayer:
+    return CachedPlayer(
+        id=player.id, uuid=player.uuid, name=player.name, color=player.color
+    )
+
+
+def team_record(team: Team) -> CachedTeam:
+    return CachedTeam(
+        id=team.id,
+        game_id=team.game_id,
+        team_code=team.team_code,
+        name=team.name,
+        quizadmin=team.quizadmin,
+    )
+
+
+# The functions below run on the database executor. They only build new
+# records and never touch the shared cache, which belongs to the event loop.
+
+
+def load_player(session, player_uuid) -> Optional[CachedPlayer]:
+    player = statements.player_by_uuid(session).params(player_uuid=player_uuid).first()
+    if player is None:
+        return None
+    return player_record(player)
+
+
+def load_game(session, game_uuid):
+    # Returns the game with its teams and roster and the Players in it
+    game = statements.game_by_uuid(session).params(game_uuid=game_uuid).first()
+    if game is None:
+        return None, []
+    cached = CachedGame(
+        id=game.id,
+        uuid=game.uuid,
+        name=game.name,
+        num_questions=game.num_questions,
+        question_order=game.questions_ordered or [],
+    )
+    for team in statements.teams_of_game(session).params(game_id=game.id):
+        cached.add_team(team_record(team))
+
+    players = []
+    rows = statements.roster_of_game(session).params(game_id=game.id)
+    for pig, player in rows:
+        players.append(player_record(player))
+        cached.add_player(
+            CachedPlayerInGame(
+                id=pig.id,
+                player_uuid=player.uuid,
+                game_uuid=cached.uuid,
+                team_id=pig.team_id,
+            )
+        )
+    return cached, players
+
+
+def insert_player(session, player_uuid) -> CachedPlayer:
+    player = Player(uuid=player_uuid, name="", color="")
+    session.add(player)
+    try:
+        session.flush()
+    except IntegrityError:
+        # created by another connection in the meantime
+        session.rollback()
+        return load_player(session, player_uuid)
+    cached = player_record(player)
+    session.commit()
+    return cached
+
+
+def update_player(session, player_id, values):
+    session.query(Player).filter(Player.id == player_id).update(values)
+    session.commit()
+
+
+def insert_player_in_game(session, game_id, player_id):
+    # Returns (id, team_id) of the new or already existing PlayerInGame
+    pig = PlayerInGame(player_id=player_id, game_id=game_id)
+    session.add(pig)
+    try:
+        session.flush()
+    except IntegrityError:
+        session.rollback()
+        pig = (
+            statements.player_in_game(session)
+            .params(player_id=player_id, game_id=game_id)
+            .one()
+        )
+    result = (pig.id, pig.team_id)
+    session.commit()
+    return result
+
+
+def move_to_team(session, game_id, pig_id, team_code) -> CachedTeam:
+    # The team row is always re-read here, so that changes made directly
+    # in the database (like setting quizadmin) are picked up on joining.
+    query = statements.team_by_code(session).params(
+        team_code=team_code, game_id=game_id
+    )
+    team = query.first()
+    if team is None:
+        team = Team(team_code=team_code, name="", game_id=game_id)
+        session.add(team)
+        try:
+            session.flush()
+        except IntegrityError:
+            session.rollback()
+            team = query.one()
+    record = team_record(team)
+    execute(session, statements.move_player_to_team, pig_id=pig_id, team_id_=record.id)
+    session.commit()
+    return record
+
+
+class StateCache:
+    """Write-through cache for the Game, Team, PlayerInGame and Player rows.
+
+    Games are loaded as a whole (teams and roster) on first access and
+    then served from memory. All writes to these rows must go through
+    the methods below, which commit first and update the cache after.
+    Changes made behind the cache's back (e.g. editing the database by
+    hand) become visible after `invalidate_game`/`invalidate_player`.
+
+    Database work is awaited through `db.run`, the cache itself is only
+    ever modified on the event loop.
+
+    `on_change(kind, uuid, change)` is awaited after every change of a
+    game ("game") or player ("player"), so that other processes can
+    invalidate their copies. Players joining a game or a team only change
+    its roster ("roster"), which other processes rather apply to their
+    copy with `apply_roster(uuid, change)` than reload the whole game.
+    """
+
+    def __init__(self, on_change=None):
+        self.games: Dict[UUID, CachedGame] = {}
+        self.players: Dict[UUID, CachedPlayer] = {}
+        self.on_change = on_change
+
+    async def _changed(self, kind, uuid, change=None):
+        if self.on_change is not None:
+            await self.on_change(kind, uuid, change)
+
+    def invalidate_game(self, game_uuid):
+        self.games.pop(as_uuid(game_uuid), None)
+
+    def invalidate_player(self, player_uuid):
+        self.players.pop(as_uuid(player_uuid), None)
+
+    async def player(self, db, player_uuid) -> Optional[CachedPlayer]:
+        if player_uuid is None:
+            return None
+        player_uuid = as_uuid(player_uuid)
+        try:
+            return self.players[player_uuid]
+        except KeyError:
+            pass
+        player = await db.run(load_player, player_uuid)
+        if player is None:
+            return None
+        return self.players.setdefault(player_uuid, player)
+
+    async def game(self, db, game_uuid) -> Optional[CachedGame]:
+        if game_uuid is None:
+            return None
+        game_uuid = as_uuid(game_uuid)
+        try:
+            return self.games[game_uuid]
+        except KeyError:
+            pass
+
+        game, players = await db.run(load_game, game_uuid)
+        if game is None:
+            return None
+        for player in players:
+            self.players.setdefault(player.uuid, player)
+        return self.games.setdefault(game_uuid, game)
+
+    async def player_in_game(
+        self, db, game: CachedGame, player: CachedPlayer
+    ) -> CachedPlayerInGame:
+        # Return (and create) the PlayerInGame for this player and game
+        try:
+            return game.players[player.uuid]
+        except KeyError:
+            pass
+        pig_id, team_id = await db.run(insert_player_in_game, game.id, player.id)
+        if player.uuid not in game.players:
+            game.add_player(
+                CachedPlayerInGame(
+                    id=pig_id,
+                    player_uuid=player.uuid,
+                    game_uuid=game.uuid,
+                    team_id=team_id,
+                )
+            )
+            await self._changed(
+                "roster", game.uuid, roster_change(game.players[player.uuid])
+            )
+        return game.players[player.uuid]
+
+    def team(self, game: CachedGame, team_id) -> Optional[CachedTeam]:
+        if game is None or team_id is None:
+            return None
+        return game.teams.get(team_id)
+
+    async def team_members(self, db, game: CachedGame, team: CachedTeam):
+        # (PlayerInGame, Player) pairs for all members of a team
+        members = []
+        for pig_id in list(team.member_ids):
+            pig = game.players_by_id[pig_id]
+            members.append((pig, await self.player(db, pig.player_uuid)))
+        return members
+
+    async def create_player(self, db, player_uuid) -> CachedPlayer:
+        player = await db.run(insert_player, as_uuid(player_uuid))
+        return self.players.setdefault(player.uuid, player)
+
+    async def update_player(self, db, player: CachedPlayer, **values):
+        await db.run(update_player, player.id, values)
+        for key, value in values.items():
+            setattr(player, key, value)
+        await self._changed("player", player.uuid)
+
+    async def set_question_order(self, game: CachedGame, order):
+        # after questions were added by `questions.import_questions`
+        game.question_order = order
+        game.num_questions = len(order)
+        await self._changed("game", game.uuid)
+
+    async def join_team(
+        self, db, game: CachedGame, pig: CachedPlayerInGame, team_code
+    ) -> CachedTeam:
+        record = await db.run(move_to_team, game.id, pig.id, team_code)
+        cached = game.merge_team(record)
+        game.move_player(pig, cached.id)
+        await self._changed("roster", game.uuid, roster_change(pig, cached))
+        return cached
+
+    def apply_roster(self, game_uuid, change):
+        # A roster change made by another process, see `roster_change`
+        game = self.games.get(as_uuid(game_uuid))
+        if game is None:
+            # it is loaded with the change on first use
+            return
+        if "team" in change:
+            game.merge_team(CachedTeam(**change["team"]))
+        pig = game.players_by_id.get(change["pig_id"])
+        if pig is None:
+            game.add_player(
+                CachedPlayerInGame(
+                    id=change["pig_id"],
+                    player_uuid=as_uuid(change["player_uuid"]),
+                    game_uuid=game.uuid,
+                    team_id=change["team_id"],
+                )
+            )
+        elif change["team_id"] is not None and change["team_id"] in game.teams:
+            game.move_player(pig, change["team_id"])
@@ -0,0 +1,129 @@
+"""Encodings of the websocket frames.
+
+A client picks its codec in `init` with a list of the codecs it
+understands, in order of preference; the server uses the first one it
+has and answers with its name. Without that list everything is JSON.
+
+- json: text frames, encoded with the standard library
+- orjson: the same text frames, encoded faster (needs orjson)
+- msgpack: binary MessagePack frames, the smallest (needs msgpack)
+
+Incoming frames are decoded by their type, text frames as JSON and
+binary frames as MessagePack, whatever codec the client asked for.
+"""
+
+import json
+
+from websockets.extensions.permessage_deflate import ServerPerMessageDeflateFactory
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class Codec:
+    def __init__(self, name, encode, decode):
+        self.name = name
+        self.encode = encode
+        self.decode = decode
+
+    def __repr__(self):
+        return f"Codec({self.name})"
+
+
+JSON = Codec("json", json.dumps, json.loads)
+
+# name -> Codec of the codecs that can be used in this process
+CODECS = {"json": JSON}
+
+if orjson is not None:
+    # orjson returns bytes, the websocket would send them as a binary frame
+    CODECS["orjson"] = Codec(
+        "orjson", lambda message: orjson.dumps(message).decode(), orjson.loads
+    )
+
+if msgpack is not None:
+    CODECS["msgpack"] = Codec(
+        "msgpack",
+        lambda message: msgpack.packb(message, use_bin_type=True),
+        lambda data: msgpack.unpackb(data, raw=False),
+    )
+
+_TEXT = CODECS.get("orjson", JSON)
+
+
+def choose(names) -> Codec:
+    # the first of the codecs a client asked for that is available
+    for name in names:
+        if name in CODECS:
+            return CODECS[name]
+    return JSON
+
+
+def decode(data):
+    """Decode an incoming frame. Raises ValueError if it cannot be decoded."""
+    if isinstance(data, str):
+        return _TEXT.decode(data)
+    if msgpack is None:
+        raise ValueError("msgpack is not installed")
+    try:
+        return CODECS["msgpack"].decode(data)
+    except Exception as e:
+        raise ValueError(e) from e
+
+
+def deflate_options(spec):
+    """Keyword arguments of websockets.serve for permessage-deflate.
+
+    "" keeps the defaults of the websockets library, "off" switches
+    compression off, otherwise a list such as
+    "window_bits=12,mem_level=5,level=6,no_context_takeover". Smaller
+    windows and memory levels cost some ratio but save memory on every
+    connection.
+    """
+    spec = spec.strip()
+    if not spec:
+        return {}
+    if spec == "off":
+        return {"compression": None}
+
+    settings = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        name, _, value = part.partition("=")
+        settings[name.strip()] = value.strip()
+    unknown = set(settings) - {
+        "window_bits",
+        "client_window_bits",
+        "mem_level",
+        "level",
+        "no_context_takeover",
+    }
+    if unknown:
+        raise ValueError(f"Unknown deflate settings {', '.join(sorted(unknown))}.")
+
+    compress_settings = {}
+    if "mem_level" in settings:
+        compress_settings["memLevel"] = int(settings["mem_level"])
+    if "level" in settings:
+        compress_settings["level"] = int(settings["level"])
+    factory = ServerPerMessageDeflateFactory(
+        server_no_context_takeover="no_context_takeover" in settings,
+        server_max_window_bits=(
+            int(settings["window_bits"]) if "window_bits" in settings else None
+        ),
+        client_max_window_bits=(
+            int(settings["client_window_bits"])
+            if "client_window_bits" in settings
+            else None
+        ),
+        compress_settings=compress_settings or None,
+    )
+    return {"extensions": [factory]}
@@ -3,18 +3,22 @@ import uuid
 
 from sqlalchemy import (
     CHAR,
+    create_engine,
+    event,
     JSON,
     Boolean,
     Column,
     DateTime,
     Enum,
     ForeignKey,
+    Index,
     Integer,
     String,
     UniqueConstraint,
 )
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from sqlalchemy.types import CHAR, TypeDecorator
@@ -100,6 +104,9 @@ class PlayerInGame(Base):
 
     __table_args__ = (
         UniqueConstraint("player_id", "game_id", name="subplayer_unique_in_game"),
+        # rosters of a game and members of a team
+        Index("ix_player_game_game_team", "game_id", "team_id"),
+        Index("ix_player_game_team", "team_id"),
     )
 
     def __str__(self):
@@ -126,7 +133,14 @@ class GivenAnswer(Base):
 
     votes = relationship("Vote")
     is_selected = Column(Enum(Selected))
-    __table_args__ = (UniqueConstraint("question_uuid", "player_id", "is_selected"),)
+    # graded by the quiz admins, None until then
+    is_correct = Column(Boolean, nullable=True)
+    __table_args__ = (
+        # also the index for the answer of a player to a question
+        UniqueConstraint("question_uuid", "player_id", "is_selected"),
+        # all answers of the players of a game or team
+        Index("ix_given_answers_player", "player_id"),
+    )
 
 
 class Question(Base):
@@ -137,6 +151,10 @@ class Question(Base):
     game_id = Column(Integer, ForeignKey("games.id"))
     game = relationship("Game", back_populates="questions")
     is_active = Column(Boolean, default=False)
+    # questions of a round are published together
+    round = Column(Integer, nullable=True)
+
+    __table_args__ = (Index("ix_questions_game", "game_id", "id"),)
 
 
 class Vote(Base):
@@ -157,8 +175,93 @@ class Game(Base):
     id = Column(Integer, primary_key=True)
     uuid = Column(GUID, default=uuid.uuid4, unique=True)
     name = Column(String)
+    # question uuids in the order of the quiz, questions that are missing
+    # follow in the order they were added
     questions_ordered = Column(JSON)
     questions = relationship("Question", order_by=Question.id, back_populates="game")
     num_questions = Column(Integer, default=20)
+    # archived games are only listed on request, NULL for older games
+    is_archived = Column(Boolean, default=False)
 
     teams = relationship("Team", backref="game")
+
+
+# Applied to every new SQLite connection of the pool. WAL lets readers
+# (and the worker processes) go on while one connection writes.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    # with WAL, NORMAL only risks the last transactions on power loss
+    "synchronous": "NORMAL",
+    # in KiB if negative
+    "cache_size": -20000,
+    "mmap_size": 256 * 1024 * 1024,
+    # wait for the lock of other processes instead of failing right away
+    "busy_timeout": 5000,
+}
+
+
+def parse_pragmas(spec):
+    # "synchronous=FULL,mmap_size=" -> {"synchronous": "FULL", "mmap_size": None}
+    pragmas = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        name, _, value = part.partition("=")
+        pragmas[name.strip()] = value.strip() or None
+    return pragmas
+
+
+# Connection pool of server databases such as PostgreSQL. Every database
+# executor thread holds at most one connection at a time.
+POOL_DEFAULTS = {
+    "pool_size": 10,
+    "max_overflow": 10,
+    # seconds to wait for a free connection
+    "pool_timeout": 10,
+    # test connections on checkout, survives database restarts
+    "pool_pre_ping": True,
+    # seconds, below the idle timeouts of the usual proxies
+    "pool_recycle": 1800,
+}
+
+
+def is_sqlite(url) -> bool:
+    return str(url).startswith("sqlite")
+
+
+def is_sqlite_memory(url) -> bool:
+    # "sqlite://" or "sqlite:///:memory:"
+    return str(url) in ("sqlite://", "sqlite:///:memory:")
+
+
+def create_db_engine(url="sqlite:///quiz.db", pragmas=None, **kwargs):
+    """Create the engine for a database url.
+
+    SQLite gets the pragma profile, `pragmas` updates SQLITE_PRAGMAS and
+    a value of None leaves a pragma at SQLite's default. Other databases
+    get a connection pool with POOL_DEFAULTS, updated by `kwargs`.
+
+    Database files are pooled as well: SQLAlchemy would open a new
+    connection for every session and run the pragmas each time.
+    """
+    if not is_sqlite(url):
+        for key, value in POOL_DEFAULTS.items():
+            kwargs.setdefault(key, value)
+        return create_engine(url, **kwargs)
+
+    profile = dict(SQLITE_PRAGMAS, **(pragmas or {}))
+    # sessions are used from the database executor threads
+    kwargs.setdefault("connect_args", {}).setdefault("check_same_thread", False)
+    if not is_sqlite_memory(url):
+        kwargs.setdefault("poolclass", QueuePool)
+    engine = create_engine(url, **kwargs)
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in profile.items():
+            if value is not None:
+                cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+    return engine
@@ -0,0 +1,106 @@
+from collections import deque
+from uuid import uuid4
+
+
+def game_stream(game_uuid):
+    return ("game", str(game_uuid).lower())
+
+
+def team_stream(team_id):
+    return ("team", team_id)
+
+
+class Event:
+    __slots__ = ("seq", "messages", "delta")
+
+    def __init__(self, seq, messages, delta):
+        self.seq = seq
+        # complete messages and, if there is one, the compact variant for
+        # clients with the "deltas" capability
+        self.messages = messages
+        self.delta = delta
+
+    def for_client(self, capabilities):
+        if self.delta is not None and "deltas" in capabilities:
+            return [self.delta]
+        return self.messages
+
+
+class EventLog:
+    """Bounded in-memory log of the events broadcast to games and teams.
+
+    Every event gets a sequence number, increasing over all streams (a
+    game or a team), and is kept in a ring buffer of its stream. A client
+    that reconnects presents the last sequence number it has seen and gets
+    the events of its game and team after that, as long as none of them
+    has rolled out of the buffers yet. The buffers of an archived game are
+    dropped with `discard`.
+
+    `epoch` changes with every process, sequence numbers of a different
+    epoch are meaningless.
+    """
+
+    def __init__(self, size=256):
+        self.size = size
+        self.epoch = uuid4().hex
+        self.seq = 0
+        self._streams = {}
+        # stream -> sequence number of the last event dropped from its buffer
+        self._dropped = {}
+        # sequence number of the last `discard`, a stream without a buffer
+        # may have had events up to there
+        self._discarded = 0
+
+    def append(self, stream, messages, delta=None, seq=None) -> int:
+        # `seq` is given if the events are numbered elsewhere, e.g. by the
+        # broker of several workers
+        self.seq = self.seq + 1 if seq is None else seq
+        for message in messages:
+            message["seq"] = self.seq
+        if delta is not None:
+            delta["seq"] = self.seq
+
+        events = self._streams.get(stream)
+        if events is None:
+            events = self._streams[stream] = deque(maxlen=self.size)
+        if len(events) == self.size:
+            self._dropped[stream] = events[0].seq
+        events.append(Event(self.seq, messages, delta))
+        return self.seq
+
+    def since(self, epoch, seq, streams):
+        """The events after `seq` in the given streams, ordered.
+
+        None if that cannot be told, i.e. the epoch differs, `seq` is no
+        sequence number of it or events after `seq` have already been
+        dropped. Both come from the client and may be anything.
+        """
+        if (
+            epoch != self.epoch
+            or not isinstance(seq, int)
+            or isinstance(seq, bool)
+            or not 0 <= seq <= self.seq
+        ):
+            return None
+        missed = []
+        for stream in streams:
+            if self._dropped.get(stream, 0) > seq:
+                return None
+            events = self._streams.get(stream)
+            if events is None:
+                if self._discarded > seq:
+                    return None
+                continue
+            # the buffers are short, walk back from the newest event
+            for event in reversed(events):
+                if event.seq <= seq:
+                    break
+                missed.append(event)
+        missed.sort(key=lambda e: e.seq)
+        return missed
+
+    def discard(self, stream):
+        # Forget a stream that gets no more events, e.g. of an archived game
+        if self._streams.pop(stream, None) is not None:
+            self._discarded = self.seq
+        self._dropped.pop(stream, None)
@@ -0,0 +1,174 @@
+"""Export the answers of a game, with their teams, votes and grades.
+
+    python export.py GAME_UUID [--format csv|jsonl] [--output FILE]
+
+The url defaults to QUIZ_DATABASE_URL or sqlite:///quiz.db. There is one
+row per answer. The rows are read with a server-side cursor in chunks
+and written as they come, so memory stays flat however large the game
+is. Quiz admins get the same export through the export_game action.
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+from itertools import islice
+
+import statements
+from db import Selected, create_db_engine
+
+COLUMNS = [
+    "answer_uuid",
+    "question_uuid",
+    "question",
+    "round",
+    "team_code",
+    "team_name",
+    "player_id",
+    "player_uuid",
+    "player_name",
+    "answer",
+    "is_selected",
+    "is_correct",
+    "votes",
+    "time_created",
+    "time_updated",
+]
+
+
+def fetch(result, chunk_size):
+    # the rows of a result, fetched `chunk_size` at a time
+    while True:
+        rows = result.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield from rows
+
+
+def answer_rows(connection, game_id, chunk_size=500):
+    """Yields a dict for every answer of a game, in the order of COLUMNS."""
+    stream = connection.execution_options(stream_results=True)
+    answers = fetch(
+        stream.execute(statements.export_answers, game_id=game_id), chunk_size
+    )
+    votes = fetch(stream.execute(statements.export_votes, game_id=game_id), chunk_size)
+    vote = next(votes, None)
+    for a in answers:
+        voters = []
+        # both are ordered by answer
+        while vote is not None and vote.answer_id <= a.id:
+            if vote.answer_id == a.id:
+                voters.append(vote.subplayer_id)
+            vote = next(votes, None)
+        yield {
+            "answer_uuid": str(a.answer_uuid),
+            "question_uuid": str(a.question_uuid),
+            "question": a.question,
+            "round": a.round,
+            "team_code": a.team_code,
+            "team_name": a.team_name,
+            "player_id": a.player_id,
+            "player_uuid": str(a.player_uuid),
+            "player_name": a.player_name,
+            "answer": a.answer,
+            "is_selected": a.is_selected == Selected.true,
+            "is_correct": a.is_correct,
+            "votes": voters,
+            "time_created": a.time_created and a.time_created.isoformat(),
+            "time_updated": a.time_updated and a.time_updated.isoformat(),
+        }
+
+
+def csv_lines(rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, COLUMNS)
+
+    def line():
+        text = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return text
+
+    writer.writeheader()
+    yield line()
+    for row in rows:
+        writer.writerow(dict(row, votes=" ".join(map(str, row["votes"]))))
+        yield line()
+
+
+def jsonl_lines(rows):
+    for row in rows:
+        yield json.dumps(row) + "\n"
+
+
+FORMATS = {"csv": csv_lines, "jsonl": jsonl_lines}
+
+
+class Export:
+    """An export read in chunks, e.g. from the database executor.
+
+    Holds its own connection and transaction until it is exhausted or
+    closed. `next_chunk()` returns the text of the next `chunk_size`
+    rows, "" at the end.
+    """
+
+    def __init__(self, engine, game_id, file_format="jsonl", chunk_size=500):
+        self.engine = engine
+        self.game_id = game_id
+        self.lines = None
+        self.format = FORMATS[file_format]
+        self.chunk_size = chunk_size
+        self._connection = None
+        self._transaction = None
+
+    def next_chunk(self) -> str:
+        if self.lines is None:
+            self._connection = self.engine.connect()
+            # a consistent snapshot on databases with MVCC
+            self._transaction = self._connection.begin()
+            rows = answer_rows(self._connection, self.game_id, self.chunk_size)
+            self.lines = self.format(rows)
+        data = "".join(islice(self.lines, self.chunk_size))
+        if not data:
+            self.close()
+        return data
+
+    def close(self):
+        if self._connection is not None:
+            self._transaction.rollback()
+            self._connection.close()
+            self._connection = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("game_uuid")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="csv")
+    parser.add_argument("--output", help="file to write to, default stdout")
+    parser.add_argument("--chunk-size", type=int, default=500, help="rows per fetch")
+    parser.add_argument(
+        "--url", default=os.environ.get("QUIZ_DATABASE_URL", "sqlite:///quiz.db")
+    )
+    args = parser.parse_args(argv)
+
+    engine = create_db_engine(args.url)
+    with engine.connect() as connection:
+        game = connection.execute(
+            statements.game_id_by_uuid, game_uuid=args.game_uuid
+        ).first()
+        if game is None:
+            parser.error(f"No game {args.game_uuid}.")
+        rows = answer_rows(connection, game.id, args.chunk_size)
+        out = open(args.output, "w", newline="") if args.output else sys.stdout
+        try:
+            for line in FORMATS[args.format](rows):
+                out.write(line)
+        finally:
+            if args.output:
+                out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+import asyncio
+import math
+import time
+from collections import deque
+
+# Budgets of the messages of a single connection: action -> (tokens per
+# second, burst). "*" is the budget of all frames together, every frame
+# takes a token of it on arrival, before it is decoded, and is dropped
+# when over budget. Valid messages then take a token of their action, if
+# it has a budget. Coalesced actions (below) are charged when they are
+# handled and wait for their budget, so their last message is never lost
+# within "*"; all others are charged on arrival and dropped when over
+# budget.
+RATE_LIMITS = {
+    "*": (20, 60),
+    "update_answer": (15, 40),
+    "vote_answer": (10, 30),
+    "unvote_answer": (10, 30),
+    "set_color": (2, 10),
+    "set_name": (2, 10),
+    # each sends the whole state of a game
+    "init": (1, 5),
+    "load_game": (1, 5),
+    "join_team": (1, 5),
+    "resume": (1, 5),
+    "import_questions": (0.2, 2),
+    "export_game": (0.1, 2),
+    "list_games": (2, 10),
+    "archive_game": (0.2, 2),
+    "profile": (0.2, 2),
+}
+
+# Actions whose effect only depends on the last one of a kind: a newer
+# message replaces one with the same key that still waits to be handled.
+# action -> (group, field of the key). A vote and an unvote of the same
+# answer belong to the same group.
+COALESCE_ACTIONS = {
+    "vote_answer": ("vote", "answer_uuid"),
+    "unvote_answer": ("vote", "answer_uuid"),
+    "update_answer": ("update_answer", "question_uuid"),
+    "set_color": ("set_color", None),
+    "set_name": ("set_name", None),
+}
+
+
+def parse_limits(spec):
+    # "*=50/100,update_answer=30/60" -> {"*": (50.0, 100.0), ...}
+    limits = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        action, _, budget = part.partition("=")
+        rate, _, burst = budget.partition("/")
+        limits[action.strip()] = (float(rate), float(burst or rate))
+    return limits
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "stamp")
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+
+    def wait(self, now) -> float:
+        # seconds until there is a token, 0 if there is one now
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else math.inf
+
+
+class RateLimiter:
+    """The token buckets of one connection, created on first use."""
+
+    def __init__(self, limits):
+        self.limits = limits
+        self._buckets = {}
+
+    def _bucket(self, action):
+        bucket = self._buckets.get(action)
+        if bucket is None:
+            budget = self.limits.get(action)
+            if budget is None:
+                return None
+            bucket = self._buckets[action] = TokenBucket(*budget)
+        return bucket
+
+    def wait(self, action) -> float:
+        # Seconds until the action fits its budget. If it fits now, a
+        # token is taken and 0 returned. "*" is the budget of the frames.
+        bucket = self._bucket(action)
+        if bucket is None:
+            return 0.0
+        wait = bucket.wait(time.monotonic())
+        if not wait:
+            bucket.tokens -= 1
+        return wait
+
+    def allow(self, action) -> bool:
+        return not self.wait(action)
+
+    def allow_frame(self) -> bool:
+        return self.allow("*")
+
+
+class Inbox:
+    """Decoded messages of one connection that wait for their handler.
+
+    The websocket is read as fast as frames arrive, so that messages can
+    be coalesced (see COALESCE_ACTIONS) while an earlier one is handled.
+    `put` returns None if the message was queued, otherwise why it was
+    dropped: "coalesced" (it replaced a waiting message), "overflow" (the
+    inbox is full) or "rate_limited". With a `limiter`, `get` holds back
+    a coalesced message until it is within its budget (see RATE_LIMITS).
+    """
+
+    def __init__(self, maxsize, limiter=None):
+        self.maxsize = maxsize
+        self.limiter = limiter
+        # [key, action, data], the entries are updated in place when coalesced
+        self._entries = deque()
+        self._waiting = {}
+        self._wakeup = asyncio.Event()
+        self.closed = False
+
+    def __len__(self):
+        return len(self._entries)
+
+    def put(self, action, data):
+        coalesce = COALESCE_ACTIONS.get(action)
+        key = None
+        if coalesce is not None:
+            group, field = coalesce
+            key = (group, data.get(field) if field else None)
+            entry = self._waiting.get(key)
+            if entry is not None:
+                entry[1], entry[2] = action, data
+                return "coalesced"
+        elif self.limiter is not None and not self.limiter.allow(action):
+            return "rate_limited"
+
+        if len(self._entries) >= self.maxsize:
+            return "overflow"
+        entry = [key, action, data]
+        self._entries.append(entry)
+        if key is not None:
+            self._waiting[key] = entry
+        self._wakeup.set()
+        return None
+
+    def close(self):
+        # no more messages, `get` returns None once the inbox is empty
+        self.closed = True
+        self._wakeup.set()
+
+    async def get(self):
+        while True:
+            while not self._entries:
+                if self.closed:
+                    return None
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            key, action, _ = self._entries[0]
+            if key is not None and self.limiter is not None and not self.closed:
+                wait = self.limiter.wait(action)
+                if wait:
+                    # still coalesced with newer messages while it waits
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(
+                            self._wakeup.wait(), None if wait == math.inf else wait
+                        )
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+            key, action, data = self._entries.popleft()
+            if key is not None:
+                del self._waiting[key]
+            return action, data
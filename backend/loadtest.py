@@ -0,0 +1,498 @@
+"""Protocol level load generator for the quiz server.
+
+Seeds a fresh SQLite database, starts `server.py` on it and connects
+simulated players that play the game through the websocket protocol:
+every game gets one quiz admin who publishes the questions one after
+another, the other players type answers, vote for and select answers
+of their team mates. For every action the round trip to the message
+that confirms it is measured.
+
+    python loadtest.py --games 4 --teams 5 --players 4 --duration 60
+
+Prints throughput and latency percentiles per action. Use `--seed` and
+`--json` to compare runs across commits.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+
+import websockets
+from sqlalchemy.orm import sessionmaker
+
+import codec
+from db import Game, Question, Team, create_db_engine
+from migrate import upgrade
+
+SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+ADMIN_CODE = "admin"
+
+
+def seed(url, games, teams, questions):
+    """Create `games` games with their teams and questions in a new database.
+
+    Returns a list of (game uuid, [question uuids], [team codes]).
+    """
+    engine = create_db_engine(url)
+    upgrade(engine)
+    session = sessionmaker(bind=engine)()
+    seeded = []
+    for g in range(games):
+        game = Game(name=f"Load test {g}", uuid=uuid.uuid4(), num_questions=questions)
+        session.add(game)
+        session.flush()
+        qs = [
+            Question(uuid=uuid.uuid4(), question=f"Question {i}?", game_id=game.id)
+            for i in range(questions)
+        ]
+        session.add_all(qs)
+        codes = [f"t{t}" for t in range(teams)]
+        session.add_all(
+            Team(name=code, team_code=code, game_id=game.id) for code in codes
+        )
+        session.add(
+            Team(name="Admins", team_code=ADMIN_CODE, game_id=game.id, quizadmin=True)
+        )
+        seeded.append((str(game.uuid), [str(q.uuid) for q in qs], codes))
+    session.commit()
+    session.close()
+    engine.dispose()
+    return seeded
+
+
+def percentile(ordered, p):
+    # nearest rank
+    if not ordered:
+        return float("nan")
+    rank = max(1, int(round(p / 100 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.timeouts = defaultdict(int)
+        self.received = 0
+        self.received_bytes = 0
+
+    def report(self, duration):
+        rows = {}
+        for action in sorted(set(self.latencies) | set(self.timeouts)):
+            ordered = sorted(self.latencies[action])
+            rows[action] = {
+                "count": len(ordered),
+                "timeouts": self.timeouts[action],
+                "per_second": len(ordered) / duration,
+                "p50_ms": percentile(ordered, 50) * 1000,
+                "p95_ms": percentile(ordered, 95) * 1000,
+                "p99_ms": percentile(ordered, 99) * 1000,
+                "max_ms": ordered[-1] * 1000 if ordered else float("nan"),
+            }
+        return rows
+
+
+class BenchClient:
+    """A websocket client that waits for the message confirming an action."""
+
+    def __init__(self, url, stats, timeout, capabilities, codec_name="json"):
+        self.url = url
+        self.capabilities = capabilities
+        self.codec_name = codec_name
+        # JSON until the server has confirmed the codec
+        self.codec = codec.JSON
+        self.stats = stats
+        self.timeout = timeout
+        self.ws = None
+        self.self_id = None
+        self.questions = {}
+        # answer_uuid -> latest answer payload of the team
+        self.answers = {}
+        self._waiters = []
+        self._reader = None
+
+    async def connect(self):
+        self.ws = await websockets.connect(self.url, max_size=None)
+        self._reader = asyncio.ensure_future(self._read())
+
+    async def close(self):
+        await self.ws.close()
+        await self._reader
+
+    async def _read(self):
+        try:
+            async for data in self.ws:
+                self.stats.received += 1
+                self.stats.received_bytes += len(data)
+                message = codec.decode(data)
+                self._track(message["msg_type"], message["payload"])
+                for waiter in list(self._waiters):
+                    predicate, future = waiter
+                    if not future.done() and predicate(message):
+                        future.set_result(message)
+                        self._waiters.remove(waiter)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    def _track(self, msg_type, payload):
+        if msg_type == "game_snapshot":
+            if payload["team"] is not None:
+                self.self_id = payload["team"]["self_id"]
+            for q in payload["questions"]:
+                self.questions[q["question_uuid"]] = q["is_active"]
+            for a in payload["answers"]:
+                self.answers[a["answer_uuid"]] = a
+        elif msg_type == "update_question":
+            self.questions[payload["question_uuid"]] = payload["is_active"]
+        elif msg_type == "update_questions":
+            for q in payload["questions"]:
+                self.questions[q["question_uuid"]] = q["is_active"]
+        elif msg_type == "answer_changed":
+            self.answers[payload["answer_uuid"]] = payload
+        elif msg_type == "answer_text_changed":
+            self.answers[payload["answer_uuid"]]["answer"] = payload["answer"]
+        elif msg_type == "vote_added":
+            self.answers[payload["answer_uuid"]]["votes"].append(payload["player_id"])
+        elif msg_type == "vote_removed":
+            self.answers[payload["answer_uuid"]]["votes"].remove(payload["player_id"])
+        elif msg_type == "selection_changed":
+            for a in self.answers.values():
+                if a["question_uuid"] == payload["question_uuid"]:
+                    a["is_selected"] = a["answer_uuid"] == payload["answer_uuid"]
+
+    async def request(self, action, predicate, **data):
+        future = asyncio.get_event_loop().create_future()
+        waiter = (predicate, future)
+        self._waiters.append(waiter)
+        start = time.perf_counter()
+        await self.ws.send(self.codec.encode(dict(data, action=action)))
+        try:
+            reply = await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            self.stats.timeouts[action] += 1
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            return None
+        self.stats.latencies[action].append(time.perf_counter() - start)
+        return reply
+
+    async def join(self, game_uuid, team_code):
+        reply = await self.request(
+            "init",
+            lambda m: m["msg_type"] == "player_id",
+            capabilities=self.capabilities,
+            codecs=[self.codec_name],
+        )
+        if reply is not None:
+            self.codec = codec.CODECS[reply["payload"]["codec"]]
+        await self.request(
+            "load_game",
+            lambda m: m["msg_type"] == "game_snapshot"
+            and m["payload"]["game"]["game_uuid"] == game_uuid,
+            game_uuid=game_uuid,
+        )
+        await self.request(
+            "join_team",
+            lambda m: m["msg_type"] == "game_snapshot"
+            and (m["payload"]["team"] or {}).get("team_code") == team_code,
+            team_code=team_code,
+        )
+
+    def active_questions(self):
+        return [q for q, active in self.questions.items() if active]
+
+    def own_answer(self, question_uuid):
+        for a in self.answers.values():
+            if a["question_uuid"] == question_uuid and a["player_id"] == self.self_id:
+                return a
+        return None
+
+
+def answered(client, text):
+    # an own answer with this text
+    def predicate(m):
+        if m["msg_type"] not in ("answer_changed", "answer_text_changed"):
+            return False
+        answer = client.answers.get(m["payload"]["answer_uuid"])
+        return answer["player_id"] == client.self_id and answer["answer"] == text
+
+    return predicate
+
+
+def changed(answer_uuid, delta_type, check):
+    # `check` is called with the answer payload or the delta
+    return lambda m: (
+        m["msg_type"] in ("answer_changed", delta_type)
+        and m["payload"]["answer_uuid"] == answer_uuid
+        and check(m["payload"])
+    )
+
+
+async def play(client, rng, args, deadline):
+    # A team player: type answers, vote and select
+    tag = uuid.uuid4().hex[:6]
+    while time.monotonic() < deadline:
+        await asyncio.sleep(rng.expovariate(1 / args.think_time))
+        questions = client.active_questions()
+        if not questions:
+            continue
+        question_uuid = rng.choice(questions)
+        if client.own_answer(question_uuid) is None or rng.random() < 0.3:
+            word = f"{tag}-{rng.randrange(10 ** 6)}"
+            for i in range(1, len(word) + 1):
+                text = word[:i]
+                await client.request(
+                    "update_answer",
+                    answered(client, text),
+                    question_uuid=question_uuid,
+                    answer=text,
+                )
+                await asyncio.sleep(rng.expovariate(1 / args.type_time))
+            continue
+
+        others = [
+            a
+            for a in client.answers.values()
+            if a["question_uuid"] == question_uuid
+            and a["player_id"] != client.self_id
+            and client.self_id not in a["votes"]
+        ]
+        if others and rng.random() < 0.7:
+            answer_uuid = rng.choice(others)["answer_uuid"]
+            await client.request(
+                "vote_answer",
+                changed(
+                    answer_uuid,
+                    "vote_added",
+                    lambda p: client.self_id in p.get("votes", [p.get("player_id")]),
+                ),
+                answer_uuid=answer_uuid,
+            )
+        else:
+            candidates = [
+                a
+                for a in client.answers.values()
+                if a["question_uuid"] == question_uuid
+            ]
+            answer_uuid = rng.choice(candidates)["answer_uuid"]
+            await client.request(
+                "select_answer",
+                changed(
+                    answer_uuid,
+                    "selection_changed",
+                    lambda p: p.get("is_selected", True),
+                ),
+                answer_uuid=answer_uuid,
+            )
+
+
+async def host(client, question_uuids, args, deadline):
+    # The quiz admin publishes the next question every question_interval
+    for question_uuid in question_uuids:
+        if time.monotonic() >= deadline:
+            break
+        await client.request(
+            "publish_question",
+            lambda m, q=question_uuid: m["msg_type"] == "update_question"
+            and m["payload"]["question_uuid"] == q
+            and m["payload"]["is_active"],
+            question_uuid=question_uuid,
+        )
+        await asyncio.sleep(args.question_interval)
+
+
+async def run(args, seeded, url):
+    stats = Stats()
+    rng = random.Random(args.seed)
+    roles = []
+    for game_uuid, question_uuids, codes in seeded:
+        roles.append((game_uuid, ADMIN_CODE, question_uuids))
+        for code in codes:
+            for _ in range(args.players):
+                roles.append((game_uuid, code, None))
+
+    # connect and join, spread over the ramp up time
+    async def start(i, role):
+        await asyncio.sleep(args.ramp * i / len(roles))
+        client = BenchClient(
+            url, stats, args.timeout, args.capabilities.split(","), args.codec
+        )
+        await client.connect()
+        await client.join(role[0], role[1])
+        return client
+
+    clients = await asyncio.gather(*(start(i, role) for i, role in enumerate(roles)))
+
+    started = time.monotonic()
+    deadline = started + args.duration
+    tasks = []
+    for client, (game_uuid, code, question_uuids) in zip(clients, roles):
+        if question_uuids is not None:
+            tasks.append(host(client, question_uuids, args, deadline))
+        else:
+            player_rng = random.Random(rng.random())
+            tasks.append(play(client, player_rng, args, deadline))
+    await asyncio.gather(*tasks)
+    elapsed = time.monotonic() - started
+
+    await asyncio.gather(*(client.close() for client in clients))
+    return stats, elapsed, len(clients)
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(SERVER),
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except OSError:
+        return None
+
+
+def print_report(rows, elapsed, clients, received, received_bytes):
+    print(
+        f"{clients} clients, {elapsed:.1f}s, {received / elapsed:.0f} frames/s, "
+        f"{received_bytes / elapsed / 1024:.0f} KiB/s received (uncompressed)"
+    )
+    header = (
+        "action",
+        "count",
+        "timeouts",
+        "per s",
+        "p50 ms",
+        "p95 ms",
+        "p99 ms",
+        "max ms",
+    )
+    print("%-18s %8s %8s %8s %8s %8s %8s %8s" % header)
+    for action, row in rows.items():
+        print(
+            "%-18s %8d %8d %8.1f %8.2f %8.2f %8.2f %8.2f"
+            % (
+                action,
+                row["count"],
+                row["timeouts"],
+                row["per_second"],
+                row["p50_ms"],
+                row["p95_ms"],
+                row["p99_ms"],
+                row["max_ms"],
+            )
+        )
+
+
+def wait_for_port(url, process, timeout=10):
+    async def probe():
+        end = time.monotonic() + timeout
+        while time.monotonic() < end:
+            if process.poll() is not None:
+                raise RuntimeError("server.py exited during start up")
+            try:
+                ws = await websockets.connect(url)
+            except OSError:
+                await asyncio.sleep(0.1)
+                continue
+            await ws.close()
+            return
+        raise RuntimeError("server.py did not start")
+
+    asyncio.get_event_loop().run_until_complete(probe())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--games", type=int, default=2)
+    parser.add_argument("--teams", type=int, default=4, help="teams per game")
+    parser.add_argument("--players", type=int, default=4, help="players per team")
+    parser.add_argument("--questions", type=int, default=20, help="questions per game")
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument("--ramp", type=float, default=2, help="seconds to connect")
+    parser.add_argument(
+        "--think-time", type=float, default=2, help="mean seconds between actions"
+    )
+    parser.add_argument(
+        "--type-time", type=float, default=0.15, help="mean seconds between keys"
+    )
+    parser.add_argument(
+        "--question-interval",
+        type=float,
+        default=5,
+        help="seconds between published questions",
+    )
+    parser.add_argument("--timeout", type=float, default=10, help="reply timeout")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--capabilities",
+        default="game_snapshot,deltas",
+        help="protocol features announced on init, comma separated",
+    )
+    parser.add_argument(
+        "--codec",
+        default="json",
+        choices=sorted(codec.CODECS),
+        help="wire codec asked for on init",
+    )
+    parser.add_argument("--url", default="ws://localhost:6789/")
+    parser.add_argument("--workdir", help="directory for quiz.db (default: temporary)")
+    parser.add_argument(
+        "--database-url",
+        help="use this database instead of a new SQLite file, e.g. a throwaway "
+        "PostgreSQL database",
+    )
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="quiz-loadtest-")
+    if args.database_url:
+        # the games are added to what is there already
+        url = args.database_url
+    else:
+        url = "sqlite:///" + os.path.join(workdir, "quiz.db")
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(os.path.join(workdir, "quiz.db" + suffix)):
+                os.remove(os.path.join(workdir, "quiz.db" + suffix))
+    seeded = seed(url, args.games, args.teams, args.questions)
+
+    env = dict(
+        os.environ,
+        QUIZ_DATABASE_URL=url,
+        QUIZ_METRICS_PORT=os.environ.get("QUIZ_METRICS_PORT", ""),
+    )
+    server = subprocess.Popen([sys.executable, SERVER], cwd=workdir, env=env)
+    try:
+        wait_for_port(args.url, server)
+        stats, elapsed, clients = asyncio.get_event_loop().run_until_complete(
+            run(args, seeded, args.url)
+        )
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait()
+
+    rows = stats.report(elapsed)
+    print_report(rows, elapsed, clients, stats.received, stats.received_bytes)
+    if args.json:
+        result = {
+            "revision": git_revision(),
+            "parameters": vars(args),
+            "clients": clients,
+            "elapsed": elapsed,
+            "frames_received": stats.received,
+            "bytes_received": stats.received_bytes,
+            "actions": rows,
+        }
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import asyncio
+from typing import Dict, List
+
+import statements
+from statements import execute
+
+
+def load_games(session_factory, archived):
+    # The lobby entries of the active or the archived games, oldest first
+    session = session_factory()
+    try:
+        rows = execute(
+            session,
+            statements.archived_games if archived else statements.active_games,
+        )
+        return [
+            {
+                "game_name": r.name,
+                "game_uuid": str(r.uuid),
+                "num_questions": r.num_questions,
+            }
+            for r in rows
+        ]
+    finally:
+        session.close()
+
+
+class Lobby:
+    """The listing of the games, cached until a game changes.
+
+    The active and the archived games are loaded separately on first
+    use, only with the columns the listing shows. `invalidate()` drops
+    both after any write to a game; a load that was running at that
+    point is returned to its callers but not kept. Games are also created
+    outside the server, so a listing is loaded again after `ttl` seconds.
+    """
+
+    def __init__(self, session_factory, executor, page_size=50, ttl=10.0):
+        self.session_factory = session_factory
+        self.executor = executor
+        self.page_size = page_size
+        self.ttl = ttl
+        self._games: Dict[bool, List[dict]] = {}
+        # archived -> loop time the listing was loaded
+        self._loaded: Dict[bool, float] = {}
+        self._loading: Dict[bool, asyncio.Future] = {}
+        self._generation = 0
+
+    def invalidate(self):
+        self._games.clear()
+        self._loading.clear()
+        self._generation += 1
+
+    async def games(self, archived=False) -> List[dict]:
+        archived = bool(archived)
+        games = self._games.get(archived)
+        now = asyncio.get_event_loop().time()
+        if games is not None and now - self._loaded[archived] < self.ttl:
+            return games
+        # connections that arrive together share one load
+        loading = self._loading.get(archived)
+        if loading is None:
+            loading = self._loading[archived] = asyncio.ensure_future(
+                self._load(archived)
+            )
+        return await asyncio.shield(loading)
+
+    async def _load(self, archived):
+        generation = self._generation
+        started = asyncio.get_event_loop().time()
+        try:
+            games = await self.executor.run(load_games, self.session_factory, archived)
+        finally:
+            if generation == self._generation:
+                self._loading.pop(archived, None)
+        if generation == self._generation:
+            self._games[archived] = games
+            self._loaded[archived] = started
+        return games
+
+    async def page(self, archived=False, offset=0, limit=None) -> dict:
+        # One page of the listing, `next_offset` is None on the last page
+        games = await self.games(archived)
+        offset = max(0, int(offset))
+        limit = (
+            self.page_size if limit is None else max(1, min(int(limit), self.page_size))
+        )
+        end = offset + limit
+        return {
+            "archived": bool(archived),
+            "games": games[offset:end],
+            "offset": offset,
+            "total": len(games),
+            "next_offset": end if end < len(games) else None,
+        }
@@ -0,0 +1,97 @@
+import logging
+import logging.handlers
+import queue
+from collections import defaultdict
+
+# Every inbound and outbound frame is logged on this logger at DEBUG level
+MESSAGE_LOG = logging.getLogger("quiz.messages")
+
+
+class MessageSampler:
+    """Decides which frames of a message type get logged.
+
+    Rates are given per message type (or action) as fractions, e.g.
+    {"update_answer": 0.01} logs every hundredth update_answer. Types
+    without a rate use `default`. Counting instead of drawing random
+    numbers keeps the decision cheap and the output reproducible.
+    """
+
+    def __init__(self, rates=None, default=1.0):
+        self.every = {}
+        for msg_type, rate in (rates or {}).items():
+            self.every[msg_type] = self._every(rate)
+        self.default = self._every(default)
+        self._seen = defaultdict(int)
+
+    @staticmethod
+    def _every(rate):
+        rate = float(rate)
+        if rate <= 0:
+            return 0
+        return max(1, round(1 / rate))
+
+    def __call__(self, msg_type) -> bool:
+        every = self.every.get(msg_type, self.default)
+        if every == 0:
+            return False
+        count = self._seen[msg_type]
+        self._seen[msg_type] = count + 1
+        return count % every == 0
+
+
+SAMPLER = MessageSampler()
+
+
+def log_message(direction, msg_type, payload):
+    # Payloads are only formatted if the frame is actually logged
+    if MESSAGE_LOG.isEnabledFor(logging.DEBUG) and SAMPLER(msg_type):
+        MESSAGE_LOG.debug("%s %s %s", msg_type, direction, payload)
+
+
+def parse_rates(spec):
+    # "update_answer=0.01,vote_answer=0.1" -> {"update_answer": 0.01, ...}
+    rates = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        msg_type, _, rate = part.partition("=")
+        rates[msg_type.strip()] = float(rate)
+    return rates
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    # The stock QueueHandler formats the record before queueing it. The
+    # listener lives in the same process, so leave that to its thread.
+    def prepare(self, record):
+        return record
+
+
+def setup_logging(level="INFO", sample_rates=None, sql_echo=False):
+    """Route all logging through a queue that is written by a background thread.
+
+    Returns the started QueueListener, stop it on shutdown to flush it.
+    """
+    global SAMPLER
+    SAMPLER = MessageSampler(sample_rates)
+
+    stream = logging.StreamHandler()
+    stream.setFormatter(
+        logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+    )
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, stream)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DeferredQueueHandler(log_queue))
+    # DEBUG is only meant for our own loggers, libraries get chatty there
+    logging.getLogger("quiz").setLevel(level)
+    root.setLevel(max(logging.getLevelName(level), logging.INFO))
+
+    # echo=True on the engine would add its own stdout handler
+    logging.getLogger("sqlalchemy.engine").setLevel(
+        logging.INFO if sql_echo else logging.WARNING
+    )
+    listener.start()
+    return listener
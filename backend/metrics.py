@@ -0,0 +1,276 @@
+import asyncio
+import bisect
+import contextvars
+import logging
+from collections import defaultdict
+
+LOG = logging.getLogger("quiz.metrics")
+
+
+class StatementCount:
+    # closed once the message is done, tasks started by the handler inherit
+    # the context but their statements no longer belong to the message
+    __slots__ = ("count", "open")
+
+    def __init__(self):
+        self.count = 0
+        self.open = True
+
+
+# The StatementCount of the message that is currently handled. It is set by
+# the dispatch loop and carried into the database threads.
+STATEMENT_COUNTER = contextvars.ContextVar("statement_counter", default=None)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(
+        '%s="%s"' % (n, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+        for n, v in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self.values = defaultdict(float)
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] += amount
+
+    def render(self):
+        lines = self.header()
+        for labels, value in self.values.items():
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Gauge(Metric):
+    """A gauge whose values are computed at scrape time by `collect`.
+
+    `collect()` returns a mapping of label tuples to values.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=(), collect=None):
+        super().__init__(name, help, labelnames)
+        self.collect = collect
+
+    def render(self):
+        lines = self.header()
+        for labels, value in self.collect().items():
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=()):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per bucket counts..., +Inf count, sum]
+        self.values = {}
+
+    def observe(self, value, *labels):
+        try:
+            counts = self.values[labels]
+        except KeyError:
+            counts = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def render(self):
+        lines = self.header()
+        names = self.labelnames + ("le",)
+        for labels, counts in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(
+                    f"{self.name}_bucket{_labels(names, labels + (bound,))} {cumulative}"
+                )
+            label_str = _labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {counts[-1]}")
+            lines.append(f"{self.name}_count{label_str} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception:
+                LOG.exception("Could not collect %s", metric.name)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144, 233)
+
+HANDLER_SECONDS = REGISTRY.add(
+    Histogram(
+        "quiz_handler_seconds",
+        "Time spent handling one message.",
+        ["action"],
+        LATENCY_BUCKETS,
+    )
+)
+HANDLER_ERRORS = REGISTRY.add(
+    Counter("quiz_handler_errors_total", "Handlers that raised.", ["action"])
+)
+SLOW_CALLBACKS = REGISTRY.add(
+    Counter(
+        "quiz_slow_callbacks_total",
+        "Callbacks that blocked the event loop too long while profiling.",
+    )
+)
+MESSAGES_DROPPED = REGISTRY.add(
+    Counter(
+        "quiz_messages_dropped_total",
+        "Incoming messages not handled, because of the rate limits (rate_limited), "
+        "a full inbox (overflow), a newer message of the same kind (coalesced) or "
+        "because they are not valid (invalid). Frames without a known action count "
+        "as action *.",
+        ["action", "reason"],
+    )
+)
+SQL_PER_MESSAGE = REGISTRY.add(
+    Histogram(
+        "quiz_sql_statements_per_message",
+        "SQL statements executed while handling one message.",
+        ["action"],
+        COUNT_BUCKETS,
+    )
+)
+SQL_BACKGROUND = REGISTRY.add(
+    Counter(
+        "quiz_sql_background_statements_total",
+        "SQL statements executed outside of a message, e.g. by the answer writer.",
+    )
+)
+BROADCAST_RECIPIENTS = REGISTRY.add(
+    Histogram(
+        "quiz_broadcast_recipients",
+        "Number of connections a broadcast was queued for.",
+        ["msg_type"],
+        COUNT_BUCKETS,
+    )
+)
+FRAMES_DROPPED = REGISTRY.add(
+    Counter(
+        "quiz_frames_dropped_total",
+        "Outgoing frames dropped because of full send queues.",
+        ["policy"],
+    )
+)
+FRAME_BYTES = REGISTRY.add(
+    Counter(
+        "quiz_frame_bytes_total",
+        "Bytes of the queued outgoing frames, before compression.",
+        ["codec"],
+    )
+)
+FRAMES_COALESCED = REGISTRY.add(
+    Counter(
+        "quiz_frames_coalesced_total",
+        "Queued outgoing frames replaced by a newer one.",
+    )
+)
+SOCKETS_CLOSED = REGISTRY.add(
+    Counter("quiz_sockets_closed_total", "Closed websockets.", ["reason"])
+)
+
+
+def count_statement(*args, **kwargs):
+    # before_cursor_execute listener
+    counter = STATEMENT_COUNTER.get()
+    if counter is None or not counter.open:
+        SQL_BACKGROUND.inc()
+    else:
+        counter.count += 1
+
+
+async def serve_http(routes, host, port):
+    """A tiny HTTP/1.0 server for GET requests.
+
+    `routes` maps paths to callables returning (content type, body), or
+    (status, content type, body) for another status than 200.
+    """
+
+    async def handle(reader, writer):
+        try:
+            request_line = await reader.readline()
+            # skip the headers
+            while (await reader.readline()).strip():
+                pass
+            method, path, *_ = request_line.decode("latin-1").split()
+            route = routes.get(path.split("?")[0]) if method == "GET" else None
+            if route is None:
+                status, content_type, body = (
+                    "404 Not Found",
+                    "text/plain",
+                    "not found\n",
+                )
+            else:
+                reply = route()
+                if len(reply) == 2:
+                    reply = ("200 OK", *reply)
+                status, content_type, body = reply
+            body = body.encode()
+            writer.write(
+                f"HTTP/1.0 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (ValueError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+def prometheus():
+    return "text/plain; version=0.0.4", REGISTRY.render()
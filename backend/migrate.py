@@ -0,0 +1,146 @@
+"""Upgrade the schema of an existing database in place.
+
+    python migrate.py [database url]
+
+The url defaults to QUIZ_DATABASE_URL or sqlite:///quiz.db. The server
+runs the same upgrade on start when asked to (quiz.py --migrate); this
+command is for upgrading before a deploy or for checking which steps are
+outstanding (--dry-run).
+"""
+
+import argparse
+import logging
+import os
+
+from sqlalchemy import Column, Integer, MetaData, Table, inspect
+
+from db import Base, Game, GivenAnswer, Question, create_db_engine
+
+LOG = logging.getLogger("quiz.migrate")
+
+schema = MetaData()
+schema_version = Table("schema_version", schema, Column("version", Integer))
+
+
+def create_indexes(connection, *tables):
+    # Add the indexes declared on the models that do not exist yet
+    inspector = inspect(connection)
+    for table in tables or Base.metadata.sorted_tables:
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(connection)
+
+
+def add_columns(table, *names):
+    # A step that adds columns of a model to its existing table
+    def step(connection):
+        existing = {c["name"] for c in inspect(connection).get_columns(table.name)}
+        quote = connection.dialect.identifier_preparer.quote
+        for name in names:
+            if name in existing:
+                continue
+            column = table.c[name]
+            connection.execute(
+                f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} "
+                f"{column.type.compile(connection.dialect)}"
+            )
+
+    return step
+
+
+def drop_indexes(table, *names):
+    # A step that drops indexes of a table that the models no longer declare
+    def step(connection):
+        existing = {i["name"] for i in inspect(connection).get_indexes(table.name)}
+        quote = connection.dialect.identifier_preparer.quote
+        for name in names:
+            if name in existing:
+                connection.execute(f"DROP INDEX {quote(name)}")
+
+    return step
+
+
+# (version, description, step) in order. A step gets the connection of the
+# transaction. New databases are created with the current models and
+# start at the last version.
+MIGRATIONS = [
+    (1, "indexes for the hot paths", create_indexes),
+    (2, "rounds of questions", add_columns(Question.__table__, "round")),
+    (3, "grades of answers", add_columns(GivenAnswer.__table__, "is_correct")),
+    (4, "archived games", add_columns(Game.__table__, "is_archived")),
+    (
+        5,
+        "drop the duplicate index of the answers",
+        drop_indexes(GivenAnswer.__table__, "ix_given_answers_question_player"),
+    ),
+]
+
+
+def current_version(connection):
+    row = connection.execute(schema_version.select()).first()
+    return 0 if row is None else row.version
+
+
+def set_version(connection, version):
+    connection.execute(schema_version.delete())
+    connection.execute(schema_version.insert().values(version=version))
+
+
+def upgrade(engine, dry_run=False):
+    """Bring the database up to the last migration. Returns the steps run."""
+    latest = MIGRATIONS[-1][0]
+    with engine.begin() as connection:
+        existing = set(inspect(connection).get_table_names())
+        if "schema_version" not in existing:
+            if dry_run:
+                return [] if not existing else MIGRATIONS
+            schema.create_all(connection)
+            if not existing:
+                Base.metadata.create_all(connection)
+                set_version(connection, latest)
+                return []
+
+        version = current_version(connection)
+        outstanding = [m for m in MIGRATIONS if m[0] > version]
+        if dry_run:
+            return outstanding
+        # tables that are new since the database was created
+        Base.metadata.create_all(connection)
+        for number, description, step in outstanding:
+            LOG.info("Migrating to %d: %s", number, description)
+            step(connection)
+            set_version(connection, number)
+    return outstanding
+
+
+def is_current(engine) -> bool:
+    # whether the schema exists and has all migrations
+    if "schema_version" not in inspect(engine).get_table_names():
+        return False
+    return not upgrade(engine, dry_run=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "url",
+        nargs="?",
+        default=os.environ.get("QUIZ_DATABASE_URL", "sqlite:///quiz.db"),
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="only list the outstanding steps"
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    engine = create_db_engine(args.url)
+    steps = upgrade(engine, dry_run=args.dry_run)
+    if not steps:
+        print("Up to date.")
+    for number, description, _ in steps:
+        print(f"{'Outstanding' if args.dry_run else 'Applied'} {number}: {description}")
+
+
+if __name__ == "__main__":
+    main()
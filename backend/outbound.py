@@ -0,0 +1,166 @@
+import asyncio
+import logging
+from collections import deque
+
+import websockets
+
+from codec import JSON
+from metrics import FRAME_BYTES, FRAMES_COALESCED, FRAMES_DROPPED, SOCKETS_CLOSED
+
+LOG = logging.getLogger("quiz.outbound")
+
+# What to do when a connection's send queue is full:
+#  drop: discard the new frame
+#  coalesce: drop the queued frames whose state a later frame carries
+#     as well (see COALESCE_KEYS); close if the queue is still full
+#  disconnect: close the connection, the client reloads everything after
+#     reconnecting
+DROP = "drop"
+COALESCE = "coalesce"
+DISCONNECT = "disconnect"
+POLICIES = (DROP, COALESCE, DISCONNECT)
+
+# Messages that carry the complete state of one object. A newer message
+# for the same object makes any queued older one obsolete.
+COALESCE_KEYS = {
+    "answer_changed": "answer_uuid",
+    "answer_text_changed": "answer_uuid",
+    "selection_changed": "question_uuid",
+    "update_question": "question_uuid",
+    "team_id": "team_code",
+    "player_id": "player_uuid",
+    "leaderboard": "game_uuid",
+}
+
+
+class Frame:
+    """A message encoded once per codec, shared by reference by all recipients."""
+
+    __slots__ = ("message", "msg_type", "key", "_encoded")
+
+    def __init__(self, message):
+        self.message = message
+        self.msg_type = message["msg_type"]
+        key_field = COALESCE_KEYS.get(self.msg_type)
+        if key_field is not None:
+            self.key = (self.msg_type, message["payload"].get(key_field))
+        else:
+            self.key = None
+        # codec -> encoded message
+        self._encoded = {}
+
+    def encode(self, codec):
+        data = self._encoded.get(codec)
+        if data is None:
+            data = self._encoded[codec] = codec.encode(self.message)
+        return data
+
+
+class SendQueue:
+    """Bounded outgoing queue of a single websocket with its writer task.
+
+    `put` never blocks, so a slow client only ever delays itself. Frames
+    are encoded with `codec` when they are queued.
+    """
+
+    def __init__(self, websocket, maxsize, policy=COALESCE, codec=JSON):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown slow consumer policy {policy}.")
+        self.websocket = websocket
+        self.maxsize = maxsize
+        self.policy = policy
+        self.codec = codec
+        self.dropped = 0
+        self.coalesced = 0
+        self.closed = False
+        self._frames = deque()
+        self._wakeup = asyncio.Event()
+        self._sent = asyncio.Event()
+        self._task = None
+
+    def __len__(self):
+        return len(self._frames)
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._writer())
+
+    def stop(self):
+        self.closed = True
+        self._frames.clear()
+        self._sent.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def put(self, frame: Frame) -> bool:
+        if self.closed:
+            return False
+
+        if len(self._frames) >= self.maxsize and self.policy == COALESCE:
+            removed = self._compact(frame.key)
+            if removed:
+                self.coalesced += removed
+                FRAMES_COALESCED.inc(amount=removed)
+
+        if len(self._frames) >= self.maxsize:
+            if self.policy == DROP:
+                self.dropped += 1
+                FRAMES_DROPPED.inc(self.policy)
+                return False
+            self._overflow()
+            return False
+
+        data = frame.encode(self.codec)
+        FRAME_BYTES.inc(self.codec.name, amount=len(data))
+        # (coalesce key, encoded frame)
+        self._frames.append((frame.key, data))
+        self._wakeup.set()
+        return True
+
+    def _compact(self, key):
+        # Drop the frames made obsolete by a later one with the same key, or
+        # by the new frame with `key`; the others keep their order
+        seen = set() if key is None else {key}
+        kept = deque()
+        for entry in reversed(self._frames):
+            if entry[0] is not None:
+                if entry[0] in seen:
+                    continue
+                seen.add(entry[0])
+            kept.appendleft(entry)
+        removed = len(self._frames) - len(kept)
+        self._frames = kept
+        return removed
+
+    async def wait_below(self, size):
+        # For bulk senders: wait until fewer than `size` frames are queued,
+        # an empty queue always does
+        size = max(size, 1)
+        while len(self._frames) >= size and not self.closed:
+            self._sent.clear()
+            await self._sent.wait()
+
+    def _overflow(self):
+        LOG.warning("Send queue of %s overflowed. Closing.", self.websocket)
+        self.dropped += len(self._frames) + 1
+        FRAMES_DROPPED.inc(self.policy, amount=len(self._frames) + 1)
+        SOCKETS_CLOSED.inc("overflow")
+        self.stop()
+        asyncio.ensure_future(self.websocket.close(1008, "send queue overflow"))
+
+    async def _writer(self):
+        try:
+            while True:
+                while not self._frames:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                _, data = self._frames.popleft()
+                await self.websocket.send(data)
+                self._sent.set()
+        except websockets.exceptions.ConnectionClosed:
+            LOG.info("Closing WS %s", self.websocket)
+            SOCKETS_CLOSED.inc("send_failed")
+        finally:
+            self.closed = True
+            self._frames.clear()
+            self._sent.set()
@@ -0,0 +1,218 @@
+"""Profiling of the running server, switched on and off at runtime.
+
+Two modes, both off until started (SIGUSR1 or the profile action, see
+server.py):
+
+- "sample": a thread records the stack of the event loop thread every
+  `interval` seconds. Cheap enough for a live quiz. Stacks are prefixed
+  with the action whose handler was running, "(loop)" otherwise, and
+  written in the collapsed format of flamegraph.pl and speedscope.
+- "handlers": every handler call runs under cProfile, the stats are
+  added up per action and written as .prof files (see pstats) with a
+  text report next to them. Exact, but slows every handler down. The
+  profile of a call also covers whatever else the loop runs while the
+  handler waits, and calls that overlap a profiled one are not profiled.
+
+While profiling, asyncio runs in debug mode and logs every callback that
+blocks the loop longer than `slow_callback` seconds, unless that is 0.
+Debug mode has its own cost, e.g. traceback.extract for every task, which
+shows up in the profiles.
+"""
+
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+from metrics import SLOW_CALLBACKS
+
+LOG = logging.getLogger("quiz.profiling")
+
+MODES = ("sample", "handlers")
+
+
+class SlowCallbackCounter(logging.Filter):
+    # asyncio logs slow callbacks in debug mode, count them
+    def filter(self, record):
+        message = record.msg
+        if isinstance(message, str) and message.startswith("Executing "):
+            SLOW_CALLBACKS.inc()
+        return True
+
+
+class Sampler(threading.Thread):
+    def __init__(self, thread_id, interval, label_code):
+        super().__init__(name="quiz-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        # frames of this code hold the action in their locals
+        self.label_code = label_code
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            label = "(loop)"
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                if code is self.label_code:
+                    label = frame.f_locals.get("action", label)
+                names.append(
+                    f"{code.co_name} ({os.path.basename(code.co_filename)}"
+                    f":{code.co_firstlineno})"
+                )
+                frame = frame.f_back
+            names.append(label)
+            self.stacks[";".join(reversed(names))] += 1
+
+
+class Profiler:
+    """Profiles the handlers of the event loop thread on demand.
+
+    `profiled(action, coroutine)` wraps every handler call. `start(mode)`
+    and `stop()` switch profiling on and off, `stop` writes the profiles
+    to `directory` and returns the paths of the files.
+    """
+
+    def __init__(self, directory="profiles", interval=0.005, slow_callback=0.1):
+        self.directory = directory
+        self.interval = interval
+        self.slow_callback = slow_callback
+        self.mode = None
+        self.started = None
+        self._sampler = None
+        # action -> pstats.Stats and number of calls, for "handlers"
+        self._stats = {}
+        self._calls = Counter()
+        self._skipped = Counter()
+        # action -> name of its handler
+        self._handlers = {}
+        self._active = False
+        self._debug = None
+        self._stop_handle = None
+        logging.getLogger("asyncio").addFilter(SlowCallbackCounter())
+
+    async def profiled(self, action, coroutine):
+        if self.mode != "handlers" or self._active:
+            if self.mode == "handlers":
+                self._skipped[action] += 1
+            return await coroutine
+        profile = cProfile.Profile()
+        self._active = True
+        profile.enable()
+        try:
+            return await coroutine
+        finally:
+            profile.disable()
+            self._active = False
+            # unless profiling was stopped meanwhile
+            if self.mode == "handlers":
+                self._calls[action] += 1
+                self._handlers[action] = coroutine.__qualname__
+                if action in self._stats:
+                    self._stats[action].add(profile)
+                else:
+                    self._stats[action] = pstats.Stats(profile)
+
+    def start(self, mode, seconds=None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown profiling mode {mode}.")
+        if self.mode is not None:
+            self.stop()
+        loop = asyncio.get_event_loop()
+        self.mode = mode
+        self.started = time.time()
+        self._debug = (loop.get_debug(), loop.slow_callback_duration)
+        if self.slow_callback:
+            loop.set_debug(True)
+            loop.slow_callback_duration = self.slow_callback
+        if mode == "sample":
+            self._sampler = Sampler(
+                threading.get_ident(), self.interval, Profiler.profiled.__code__
+            )
+            self._sampler.start()
+        if seconds:
+            self._stop_handle = loop.call_later(seconds, self.stop)
+        LOG.warning("Profiling started (%s).", mode)
+
+    def stop(self):
+        if self.mode is None:
+            return []
+        loop = asyncio.get_event_loop()
+        loop.set_debug(self._debug[0])
+        loop.slow_callback_duration = self._debug[1]
+        if self._stop_handle is not None:
+            self._stop_handle.cancel()
+            self._stop_handle = None
+        mode, self.mode = self.mode, None
+        try:
+            if mode == "sample":
+                self._sampler.stop()
+                stacks, self._sampler = self._sampler.stacks, None
+                paths = self._write_samples(stacks)
+            else:
+                paths = self._write_stats()
+        finally:
+            self._stats, self._calls, self._skipped = {}, Counter(), Counter()
+            self._handlers = {}
+        LOG.warning("Profiling stopped (%s), wrote %s.", mode, ", ".join(paths))
+        return paths
+
+    def toggle(self, mode):
+        # for the signal handler
+        if self.mode is None:
+            self.start(mode)
+        else:
+            self.stop()
+
+    def _path(self, name):
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started))
+        return os.path.join(self.directory, f"{stamp}-{os.getpid()}-{name}")
+
+    def _write_samples(self, stacks):
+        path = self._path("sample.collapsed")
+        with open(path, "w") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        # samples per action, (loop) is everything outside of handlers
+        per_action = Counter()
+        for stack, count in stacks.items():
+            per_action[stack.partition(";")[0]] += count
+        summary = self._path("sample.txt")
+        total = sum(per_action.values()) or 1
+        with open(summary, "w") as f:
+            f.write(f"{total} samples every {self.interval * 1000:g} ms\n")
+            for action, count in per_action.most_common():
+                f.write(f"{action:<24} {count:>8} {count / total:>7.1%}\n")
+        return [path, summary]
+
+    def _write_stats(self):
+        paths = []
+        for action, action_stats in self._stats.items():
+            path = self._path(f"{action}.prof")
+            action_stats.dump_stats(path)
+            report = io.StringIO()
+            report.write(
+                f"message {action}, handler {self._handlers[action]}: "
+                f"{self._calls[action]} calls profiled, {self._skipped[action]} "
+                "overlapping calls skipped\n\n"
+            )
+            action_stats.stream = report
+            action_stats.sort_stats("cumulative").print_stats(40)
+            with open(self._path(f"{action}.txt"), "w") as f:
+                f.write(report.getvalue())
+            paths.append(path)
+        return paths
@@ -0,0 +1,154 @@
+"""Time the statements of the hot paths, built per call and cached.
+
+Seeds an in-memory SQLite database with one game and compares, per
+call, the ORM query chains the handlers used to build for every message
+with the baked queries and Core statements of statements.py.
+
+    python querybench.py --number 2000
+
+The "build" rows construct and compile the statement without running
+it, that is the part the caching saves.
+"""
+
+import argparse
+import timeit
+import uuid
+
+from sqlalchemy.orm import joinedload, sessionmaker
+
+import statements
+from db import (
+    Game,
+    GivenAnswer,
+    Player,
+    PlayerInGame,
+    Question,
+    Selected,
+    Team,
+    create_db_engine,
+)
+from migrate import upgrade
+from statements import execute
+
+
+def seed(session, teams=5, players=4, questions=20):
+    game = Game(name="Bench", uuid=uuid.uuid4(), num_questions=questions)
+    session.add(game)
+    session.flush()
+    qs = [
+        Question(uuid=uuid.uuid4(), question=f"Question {i}?", game_id=game.id)
+        for i in range(questions)
+    ]
+    session.add_all(qs)
+    answers = []
+    for t in range(teams):
+        team = Team(name=f"t{t}", team_code=f"t{t}", game_id=game.id)
+        session.add(team)
+        session.flush()
+        for p in range(players):
+            player = Player(name=f"p{t}.{p}", color="#000000")
+            pig = PlayerInGame(player=player, game_id=game.id, team_id=team.id)
+            session.add(pig)
+            session.flush()
+            for q in qs:
+                answers.append(
+                    GivenAnswer(answer="x", question_uuid=q.uuid, player_id=pig.id)
+                )
+    session.add_all(answers)
+    session.commit()
+    return game, team, pig, answers[-1]
+
+
+def cases(session, game, team, pig, answer):
+    """(name, built per call, cached) callables, cached is None for builds."""
+
+    def team_players():
+        return session.query(PlayerInGame.id).filter(PlayerInGame.team_id == team.id)
+
+    def old_answer_of_player():
+        return (
+            session.query(GivenAnswer)
+            .filter(GivenAnswer.question_uuid == answer.question_uuid)
+            .filter(GivenAnswer.player_id == pig.id)
+        )
+
+    def new_answer_of_player():
+        return statements.answer_of_player(session).params(
+            question_uuid=answer.question_uuid, player_id=pig.id
+        )
+
+    def old_game_state():
+        return (
+            session.query(GivenAnswer, PlayerInGame.team_id)
+            .join(GivenAnswer.player)
+            .filter(PlayerInGame.game_id == game.id)
+            .filter(PlayerInGame.team_id == team.id)
+            .options(joinedload(GivenAnswer.votes))
+            .order_by(GivenAnswer.id)
+        )
+
+    def new_game_state():
+        return statements.answers_of_team(session).params(
+            game_id=game.id, team_id=team.id
+        )
+
+    def old_select():
+        session.query(GivenAnswer).filter(
+            GivenAnswer.uuid == answer.uuid,
+            GivenAnswer.player_id.in_(team_players().subquery()),
+        ).update({"is_selected": Selected.true}, synchronize_session=False)
+
+    def new_select():
+        execute(
+            session,
+            statements.set_answer_selected,
+            answer_uuid=answer.uuid,
+            selected=Selected.true,
+        )
+
+    def compile_query(query):
+        return lambda: str(query().statement.compile(session.bind))
+
+    return [
+        ("build answer_of_player", compile_query(old_answer_of_player), None),
+        (
+            "answer_of_player",
+            lambda: old_answer_of_player().first(),
+            lambda: new_answer_of_player().first(),
+        ),
+        ("build game_state", compile_query(old_game_state), None),
+        (
+            "game_state",
+            lambda: old_game_state().all(),
+            lambda: new_game_state().all(),
+        ),
+        ("select answer", old_select, new_select),
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--number", type=int, default=1000, help="calls per case")
+    args = parser.parse_args(argv)
+
+    engine = create_db_engine("sqlite://")
+    upgrade(engine)
+    session = sessionmaker(bind=engine)()
+    rows = cases(session, *seed(session))
+
+    print(f"{'case':<24}{'per call':>12}{'cached':>12}  (us per call)")
+    for name, old, new in rows:
+        timings = [
+            (
+                f"{timeit.timeit(f, number=args.number) / args.number * 1e6:>12.1f}"
+                if f is not None
+                else f"{'-':>12}"
+            )
+            for f in (old, new)
+        ]
+        print(f"{name:<24}{''.join(timings)}")
+        session.rollback()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Import the questions of a game from a JSON or CSV file.
+
+    python questions.py GAME_UUID questions.csv [--url URL] [--migrate]
+
+The url defaults to QUIZ_DATABASE_URL or sqlite:///quiz.db. A JSON file
+holds a list of questions, each a string or an object with "question"
+and optionally "round". A CSV file has a header with a "question" and
+optionally a "round" column. The questions are appended to the order of
+the game in the order of the file and are not published yet. The schema
+is only upgraded with --migrate, like the server does.
+
+Quiz admins can do the same through the import_questions action.
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import uuid
+
+from sqlalchemy.orm import sessionmaker
+
+import statements
+from db import Game, Question, create_db_engine
+from migrate import is_current, upgrade
+
+
+def parse_questions(items):
+    # [str | {"question": str, "round": int}] -> [{"question", "round"}]
+    questions = []
+    for item in items:
+        if isinstance(item, str):
+            item = {"question": item}
+        text = str(item.get("question") or "").strip()
+        if not text:
+            raise ValueError(f"Question without text: {item!r}")
+        round_ = item.get("round")
+        questions.append(
+            {
+                "question": text,
+                "round": int(round_) if round_ not in (None, "") else None,
+            }
+        )
+    return questions
+
+
+def read_questions(text, file_format):
+    if file_format == "json":
+        items = json.loads(text)
+        if isinstance(items, dict):
+            items = items["questions"]
+    elif file_format == "csv":
+        items = list(csv.DictReader(io.StringIO(text)))
+    else:
+        raise ValueError(f"Unknown format {file_format}.")
+    return parse_questions(items)
+
+
+def ordered(questions, order):
+    # the questions of a game in the order of Game.questions_ordered
+    position = {question_uuid: i for i, question_uuid in enumerate(order or ())}
+    return sorted(
+        questions, key=lambda q: (position.get(str(q.uuid), len(position)), q.id)
+    )
+
+
+def question_order(session, game_id, order):
+    # The uuids of all questions of a game in order, as strings
+    questions = statements.questions_of_game(session).params(game_id=game_id).all()
+    return [str(q.uuid) for q in ordered(questions, order)]
+
+
+def import_questions(session, game_id, questions) -> list:
+    """Add questions to a game in one batch. Returns the new order."""
+    game = session.query(Game).get(game_id)
+    order = question_order(session, game_id, game.questions_ordered)
+    rows = [
+        dict(q, uuid=uuid.uuid4(), game_id=game_id, is_active=False) for q in questions
+    ]
+    session.bulk_insert_mappings(Question, rows)
+    order += [str(row["uuid"]) for row in rows]
+    game.questions_ordered = order
+    game.num_questions = len(order)
+    session.commit()
+    return order
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("game_uuid")
+    parser.add_argument("file", help="a .json or .csv file, - for stdin")
+    parser.add_argument("--format", choices=("json", "csv"))
+    parser.add_argument(
+        "--url", default=os.environ.get("QUIZ_DATABASE_URL", "sqlite:///quiz.db")
+    )
+    parser.add_argument(
+        "--migrate", action="store_true", help="create or upgrade the schema"
+    )
+    args = parser.parse_args(argv)
+
+    file_format = args.format or os.path.splitext(args.file)[1].lstrip(".").lower()
+    if args.file == "-":
+        text = sys.stdin.read()
+    else:
+        with open(args.file, newline="") as f:
+            text = f.read()
+    questions = read_questions(text, file_format)
+
+    engine = create_db_engine(args.url)
+    if args.migrate:
+        upgrade(engine)
+    elif not is_current(engine):
+        parser.error("The database schema is not current, see migrate.py.")
+    session = sessionmaker(bind=engine)()
+    game = statements.game_by_uuid(session).params(game_uuid=args.game_uuid).first()
+    if game is None:
+        parser.error(f"No game {args.game_uuid}.")
+    order = import_questions(session, game.id, questions)
+    print(f"Imported {len(questions)} questions, the game has {len(order)}.")
+
+
+if __name__ == "__main__":
+    main()
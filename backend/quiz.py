@@ -0,0 +1,65 @@
+"""Start the quiz server.
+
+    python quiz.py [--config quiz.ini] [--migrate] [--seed] [--port 6789] ...
+
+See config.py for the config file. The database schema is only created or
+upgraded with --migrate (or QUIZ_MIGRATE), the demo games are only added
+with --seed (or QUIZ_SEED); without --migrate the server refuses to start
+on a database that is behind. With a metrics port, GET /ready answers 200
+once the caches are warm and the websocket listener is up, 503 before.
+"""
+
+import argparse
+import os
+import sys
+
+from config import apply, read_config
+
+# flag -> variable, see server.py
+FLAGS = {
+    "database_url": "QUIZ_DATABASE_URL",
+    "host": "QUIZ_HOST",
+    "port": "QUIZ_PORT",
+    "metrics_port": "QUIZ_METRICS_PORT",
+    "workers": "QUIZ_WORKERS",
+    "log_level": "QUIZ_LOG_LEVEL",
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--config", default=os.environ.get("QUIZ_CONFIG"), help="an ini file"
+    )
+    parser.add_argument("--database-url")
+    parser.add_argument("--host", help="address to listen on, default localhost")
+    parser.add_argument("--port", type=int, help="websocket port, default 6789")
+    parser.add_argument(
+        "--metrics-port", help="port of /metrics and /ready, empty to disable"
+    )
+    parser.add_argument("--workers", type=int, help="server processes")
+    parser.add_argument("--log-level")
+    parser.add_argument(
+        "--migrate", action="store_true", help="create or upgrade the schema"
+    )
+    parser.add_argument("--seed", action="store_true", help="add the demo games")
+    args = parser.parse_args(argv)
+
+    if args.config:
+        try:
+            apply(read_config(args.config))
+        except (OSError, ValueError) as e:
+            parser.error(f"Cannot read {args.config}: {e}")
+    flags = {variable: getattr(args, name) for name, variable in FLAGS.items()}
+    flags["QUIZ_MIGRATE"] = "1" if args.migrate else None
+    flags["QUIZ_SEED"] = "1" if args.seed else None
+    apply(flags, override=True)
+
+    # the settings are read when the server is imported
+    import server
+
+    server.main()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+import asyncio
+import logging
+
+from cache import as_uuid
+
+LOG = logging.getLogger("quiz.registry")
+
+
+class ConnectionRecord:
+    # the state the manager keeps for every open connection
+    __slots__ = ("game_uuid", "team_id", "last_seen", "pong", "ping_sent")
+
+    def __init__(self, now):
+        self.game_uuid = None
+        self.team_id = None
+        # loop time of the last frame received
+        self.last_seen = now
+        # waiter of an unanswered ping
+        self.pong = None
+        self.ping_sent = None
+
+
+class ConnectionManager:
+    """Owns the bookkeeping of all open connections.
+
+    Every connection is `add`ed when it opens and `remove`d when it
+    closes, which drops all its state at once. Besides the record of each
+    connection it keeps the reverse indexes team_id -> connections and
+    game_uuid -> connections, so that a broadcast only has to touch its
+    actual recipients.
+
+    `heartbeat` pings connections that have been silent for `interval`
+    seconds and closes those that do not answer within `timeout`, so that
+    half-open connections are noticed even if nothing is sent to them.
+    Connections are objects with a `websocket`.
+    """
+
+    def __init__(self, interval=20.0, timeout=20.0):
+        self.interval = interval
+        self.timeout = timeout
+        self._records = {}
+        self._teams = {}
+        self._games = {}
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def counts(self):
+        # sizes of the bookkeeping, to check that it stays bounded
+        return {
+            "connections": len(self._records),
+            "games": len(self._games),
+            "teams": len(self._teams),
+        }
+
+    @staticmethod
+    def _discard(index, key, connection):
+        members = index.get(key)
+        if members is None:
+            return
+        members.discard(connection)
+        if not members:
+            del index[key]
+
+    def add(self, connection):
+        self._records[connection] = ConnectionRecord(asyncio.get_event_loop().time())
+
+    def remove(self, connection):
+        record = self._records.pop(connection, None)
+        if record is None:
+            return
+        if record.team_id is not None:
+            self._discard(self._teams, record.team_id, connection)
+        if record.game_uuid is not None:
+            self._discard(self._games, record.game_uuid, connection)
+        if record.pong is not None:
+            record.pong.cancel()
+
+    def seen(self, connection):
+        # a frame arrived, the connection is alive
+        record = self._records.get(connection)
+        if record is not None:
+            record.last_seen = asyncio.get_event_loop().time()
+
+    def set_game(self, connection, game_uuid):
+        record = self._records[connection]
+        game_uuid = str(as_uuid(game_uuid))
+        if record.game_uuid == game_uuid:
+            return
+        if record.game_uuid is not None:
+            self._discard(self._games, record.game_uuid, connection)
+            # a team always belongs to a single game
+            self._discard(self._teams, record.team_id, connection)
+            record.team_id = None
+        record.game_uuid = game_uuid
+        self._games.setdefault(game_uuid, set()).add(connection)
+
+    def set_team(self, connection, team_id):
+        record = self._records[connection]
+        if record.team_id == team_id:
+            return
+        if record.team_id is not None:
+            self._discard(self._teams, record.team_id, connection)
+        record.team_id = team_id
+        self._teams.setdefault(team_id, set()).add(connection)
+
+    def team_id(self, connection):
+        record = self._records.get(connection)
+        return None if record is None else record.team_id
+
+    def game_uuid(self, connection):
+        record = self._records.get(connection)
+        return None if record is None else record.game_uuid
+
+    def in_team(self, team_id):
+        return self._teams.get(team_id, ())
+
+    def in_game(self, game_uuid):
+        return self._games.get(str(as_uuid(game_uuid)), ())
+
+    def game_sizes(self):
+        return {game_uuid: len(members) for game_uuid, members in self._games.items()}
+
+    async def _ping(self, connection, record):
+        try:
+            pong = await connection.websocket.ping()
+            await pong
+        except Exception:
+            # the connection is closing, `remove` follows
+            return
+        record.last_seen = asyncio.get_event_loop().time()
+
+    async def heartbeat(self, close):
+        """Run forever, `close(connection)` is called for dead connections."""
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(min(self.interval, self.timeout) / 2)
+            now = loop.time()
+            for connection, record in list(self._records.items()):
+                if record.pong is not None:
+                    if record.pong.done():
+                        # answered, or the connection is closing anyway
+                        record.pong = None
+                    elif now - record.ping_sent > self.timeout:
+                        LOG.info("No pong from %s. Closing.", connection)
+                        record.pong.cancel()
+                        close(connection)
+                elif now - record.last_seen >= self.interval:
+                    record.ping_sent = now
+                    record.pong = asyncio.ensure_future(self._ping(connection, record))
@@ -0,0 +1,175 @@
+import asyncio
+import logging
+from typing import Dict, Optional, Tuple
+
+import statements
+from statements import execute
+
+LOG = logging.getLogger("quiz.scoreboard")
+
+
+def load_grades(session, game_id):
+    # (answer_uuid, team_id, is_correct) of the graded answers of a game
+    rows = execute(session, statements.grades_of_game, game_id=game_id)
+    return [(str(r.uuid), r.team_id, r.is_correct) for r in rows]
+
+
+def write_grades(session, grades):
+    execute(
+        session,
+        statements.grade_answer,
+        [{"answer_uuid": u, "correct": c} for u, c in grades.items()],
+    )
+    session.commit()
+
+
+class GameScores:
+    __slots__ = ("scores", "grades", "loaded")
+
+    def __init__(self):
+        # team_id -> points
+        self.scores: Dict[int, int] = {}
+        # answer_uuid -> (team_id, is_correct)
+        self.grades: Dict[str, Tuple[int, bool]] = {}
+        self.loaded = False
+
+    def apply(self, answer_uuid, team_id, correct: Optional[bool]):
+        old = self.grades.pop(answer_uuid, None)
+        if old is not None and old[1]:
+            self.scores[old[0]] -= 1
+        if correct is not None:
+            self.grades[answer_uuid] = (team_id, correct)
+            if correct:
+                self.scores[team_id] = self.scores.get(team_id, 0) + 1
+
+
+class Scoreboard:
+    """The points of the teams of every game, one per correct answer.
+
+    Only selected answers are graded, unselecting an answer clears its
+    grade, so a team scores at most once per question.
+
+    A game is loaded from the database once (`load`), after that every
+    grade changes the points of a single team (`apply`). Grades made in
+    this process are written in batches (`record`), at most every `delay`
+    seconds.
+
+    `on_change(game_uuid)` is called when the points of a game changed,
+    but at most every `interval` seconds per game, so that a burst of
+    grades leads to a single leaderboard update.
+    """
+
+    MAX_ATTEMPTS = 3
+
+    def __init__(self, db, interval=1.0, delay=1.0):
+        # db is the DBSession the grades are written in
+        self.db = db
+        self.interval = interval
+        self.delay = delay
+        self.on_change = None
+        self._games: Dict[str, GameScores] = {}
+        # answer_uuid -> is_correct, not written yet
+        self._pending: Dict[str, Optional[bool]] = {}
+        self._attempts = 0
+        self._lock = asyncio.Lock()
+        self._task = None
+        # game_uuid -> loop time of the last on_change
+        self._changed: Dict[str, float] = {}
+        self._scheduled = set()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _game(self, game_uuid) -> GameScores:
+        scores = self._games.get(game_uuid)
+        if scores is None:
+            scores = self._games[game_uuid] = GameScores()
+        return scores
+
+    async def load(self, db, game_uuid, game_id) -> Dict[int, int]:
+        # The points of the teams of a game
+        scores = self._game(game_uuid)
+        if not scores.loaded:
+            graded = await db.run(load_grades, game_id)
+            if not scores.loaded:
+                # grades applied while loading are newer
+                for answer_uuid, team_id, correct in graded:
+                    if answer_uuid not in scores.grades:
+                        scores.grades[answer_uuid] = (team_id, correct)
+                scores.scores = {}
+                for team_id, correct in scores.grades.values():
+                    if correct:
+                        scores.scores[team_id] = scores.scores.get(team_id, 0) + 1
+                scores.loaded = True
+        return scores.scores
+
+    def scores(self, game_uuid) -> Optional[Dict[int, int]]:
+        # None if the game has not been loaded in this process
+        scores = self._games.get(game_uuid)
+        return scores.scores if scores is not None and scores.loaded else None
+
+    def grade(self, game_uuid, answer_uuid) -> Optional[bool]:
+        scores = self._games.get(game_uuid)
+        grade = scores.grades.get(answer_uuid) if scores is not None else None
+        return None if grade is None else grade[1]
+
+    def graded(self, game_uuid, answer_uuid) -> bool:
+        # whether the answer has a grade, written or not
+        if self._pending.get(answer_uuid) is not None:
+            return True
+        return self.grade(game_uuid, answer_uuid) is not None
+
+    def apply(self, game_uuid, answer_uuid, team_id, correct):
+        # A grade of any process
+        self._game(game_uuid).apply(answer_uuid, team_id, correct)
+        self._notify(game_uuid)
+
+    def record(self, answer_uuid, correct):
+        # A grade made in this process, written later
+        self._pending[answer_uuid] = correct
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._write_later())
+
+    def _notify(self, game_uuid):
+        if self.on_change is None or game_uuid in self._scheduled:
+            return
+        loop = asyncio.get_event_loop()
+        wait = (
+            self._changed.get(game_uuid, -self.interval) + self.interval - loop.time()
+        )
+        if wait <= 0:
+            self._call(game_uuid)
+        else:
+            self._scheduled.add(game_uuid)
+            loop.call_later(wait, self._call, game_uuid)
+
+    def _call(self, game_uuid):
+        self._scheduled.discard(game_uuid)
+        self._changed[game_uuid] = asyncio.get_event_loop().time()
+        try:
+            self.on_change(game_uuid)
+        except Exception:
+            LOG.exception("Could not send the leaderboard of %s", game_uuid)
+
+    async def _write_later(self):
+        await asyncio.sleep(self.delay)
+        await self.flush()
+
+    async def flush(self):
+        async with self._lock:
+            if not self._pending:
+                return
+            grades, self._pending = self._pending, {}
+            try:
+                await self.db.run(write_grades, grades)
+                self._attempts = 0
+            except Exception:
+                LOG.exception("Could not store %d grades", len(grades))
+                self._attempts += 1
+                if self._attempts >= self.MAX_ATTEMPTS:
+                    LOG.error("Giving up on %d grades.", len(grades))
+                    self._attempts = 0
+                    return
+                # newer grades of the same answers win
+                self._pending = {**grades, **self._pending}
+                self._task = asyncio.ensure_future(self._write_later())
@@ -0,0 +1,293 @@
+"""The statements of the hot paths, built once.
+
+Building an ORM query and compiling it to SQL costs more Python time
+than running it on SQLite. The statements here are constructed at
+import with bind parameters and compiled once per dialect:
+
+- ORM loads are baked queries; the bakery caches them by the code of
+  their lambdas, together with their compiled SQL.
+- Writes and plain lookups are Core statements, run through `execute`
+  with a compiled cache.
+
+See querybench.py for the difference per call.
+"""
+
+from sqlalchemy import Boolean, Integer, and_, bindparam, delete, or_, select, update
+from sqlalchemy.ext import baked
+from sqlalchemy.orm import joinedload
+from sqlalchemy.util import LRUCache
+
+from db import Game, GivenAnswer, Player, PlayerInGame, Question, Selected, Team, Vote
+
+bakery = baked.bakery()
+
+# compiled forms of the Core statements below, by statement and dialect
+COMPILED = LRUCache(200)
+
+
+def execute(session, statement, *multiparams, **params):
+    """Run a statement built once in the transaction of the session.
+
+    Several parameter dicts are executed as one executemany.
+    """
+    connection = session.connection().execution_options(compiled_cache=COMPILED)
+    return connection.execute(statement, *multiparams, **params)
+
+
+# Baked ORM queries, call them with the session and set the parameters
+# with .params()
+
+game_by_uuid = bakery(lambda s: s.query(Game))
+game_by_uuid += lambda q: q.filter(Game.uuid == bindparam("game_uuid"))
+
+teams_of_game = bakery(lambda s: s.query(Team))
+teams_of_game += lambda q: q.filter(Team.game_id == bindparam("game_id"))
+
+team_by_code = bakery(lambda s: s.query(Team))
+team_by_code += lambda q: q.filter(Team.team_code == bindparam("team_code"))
+team_by_code += lambda q: q.filter(Team.game_id == bindparam("game_id"))
+
+player_by_uuid = bakery(lambda s: s.query(Player))
+player_by_uuid += lambda q: q.filter(Player.uuid == bindparam("player_uuid"))
+
+roster_of_game = bakery(lambda s: s.query(PlayerInGame, Player))
+roster_of_game += lambda q: q.join(PlayerInGame.player)
+roster_of_game += lambda q: q.filter(PlayerInGame.game_id == bindparam("game_id"))
+roster_of_game += lambda q: q.order_by(PlayerInGame.id)
+
+player_in_game = bakery(lambda s: s.query(PlayerInGame))
+player_in_game += lambda q: q.filter(PlayerInGame.player_id == bindparam("player_id"))
+player_in_game += lambda q: q.filter(PlayerInGame.game_id == bindparam("game_id"))
+
+question_by_uuid = bakery(lambda s: s.query(Question))
+question_by_uuid += lambda q: q.filter(Question.uuid == bindparam("question_uuid"))
+
+questions_of_game = bakery(lambda s: s.query(Question))
+questions_of_game += lambda q: q.filter(Question.game_id == bindparam("game_id"))
+questions_of_game += lambda q: q.order_by(Question.id)
+
+answer_by_uuid = bakery(lambda s: s.query(GivenAnswer))
+answer_by_uuid += lambda q: q.filter(GivenAnswer.uuid == bindparam("answer_uuid"))
+
+answer_of_player = bakery(lambda s: s.query(GivenAnswer))
+answer_of_player += lambda q: q.filter(
+    GivenAnswer.question_uuid == bindparam("question_uuid")
+)
+answer_of_player += lambda q: q.filter(GivenAnswer.player_id == bindparam("player_id"))
+
+# the answers of a team, with the team of each answer, see game_state
+_answers_of_game = (
+    lambda s: s.query(GivenAnswer, PlayerInGame.team_id)
+    .join(GivenAnswer.player)
+    .filter(PlayerInGame.game_id == bindparam("game_id"))
+    .options(joinedload(GivenAnswer.votes))
+    .order_by(GivenAnswer.id)
+)
+answers_of_team = bakery(_answers_of_game)
+answers_of_team += lambda q: q.filter(PlayerInGame.team_id == bindparam("team_id"))
+# for admins also the selected answers of all other teams
+answers_of_team_and_selected = bakery(_answers_of_game)
+answers_of_team_and_selected += lambda q: q.filter(
+    (PlayerInGame.team_id == bindparam("team_id"))
+    | (GivenAnswer.is_selected == Selected.true)
+)
+
+
+# Core statements, run them with execute()
+
+_team_players = select([PlayerInGame.id]).where(
+    PlayerInGame.team_id == bindparam("team_id")
+)
+
+game_id_by_uuid = select([Game.id]).where(Game.uuid == bindparam("game_uuid"))
+
+question_exists = select([Question.id]).where(
+    Question.uuid == bindparam("question_uuid")
+)
+
+# the question of an answer, if the answer was given in the team
+answer_question_in_team = select([GivenAnswer.question_uuid]).where(
+    and_(
+        GivenAnswer.uuid == bindparam("answer_uuid"),
+        GivenAnswer.player_id.in_(_team_players),
+    )
+)
+
+# the answer a team selected for a question with its grade; an answer
+# only keeps its grade while it is selected
+team_selection = select([GivenAnswer.uuid, GivenAnswer.is_correct]).where(
+    and_(
+        GivenAnswer.question_uuid == bindparam("question_uuid_"),
+        GivenAnswer.is_selected == Selected.true,
+        GivenAnswer.player_id.in_(_team_players),
+    )
+)
+
+unselect_other_answers = (
+    update(GivenAnswer.__table__)
+    .where(
+        and_(
+            GivenAnswer.question_uuid == bindparam("question_uuid_"),
+            GivenAnswer.is_selected == Selected.true,
+            GivenAnswer.player_id.in_(_team_players),
+            GivenAnswer.uuid != bindparam("answer_uuid"),
+        )
+    )
+    .values(is_selected=None, is_correct=None)
+)
+
+unselect_answer = (
+    update(GivenAnswer.__table__)
+    .where(GivenAnswer.uuid == bindparam("answer_uuid"))
+    .values(is_selected=None, is_correct=None)
+)
+
+set_answer_selected = (
+    update(GivenAnswer.__table__)
+    .where(GivenAnswer.uuid == bindparam("answer_uuid"))
+    .values(is_selected=bindparam("selected"))
+)
+
+# inserts nothing if the answer is not in the team
+insert_vote = Vote.__table__.insert().from_select(
+    ["answer_id", "subplayer_id"],
+    select([GivenAnswer.id, bindparam("voter", type_=Integer)]).where(
+        and_(
+            GivenAnswer.uuid == bindparam("answer_uuid"),
+            GivenAnswer.player_id.in_(_team_players),
+        )
+    ),
+)
+
+delete_vote = delete(Vote.__table__).where(
+    and_(
+        Vote.answer_id.in_(
+            select([GivenAnswer.id]).where(GivenAnswer.uuid == bindparam("answer_uuid"))
+        ),
+        Vote.subplayer_id == bindparam("voter"),
+    )
+)
+
+update_answer_text = (
+    update(GivenAnswer.__table__)
+    .where(GivenAnswer.uuid == bindparam("answer_uuid"))
+    .values(answer=bindparam("text"))
+)
+
+# the team of an answer of the game and whether it is selected
+answer_team_in_game = (
+    select([PlayerInGame.team_id, GivenAnswer.is_selected])
+    .select_from(GivenAnswer.__table__.join(PlayerInGame.__table__))
+    .where(
+        and_(
+            GivenAnswer.uuid == bindparam("answer_uuid"),
+            PlayerInGame.game_id == bindparam("game_id"),
+        )
+    )
+)
+
+grades_of_game = (
+    select([GivenAnswer.uuid, PlayerInGame.team_id, GivenAnswer.is_correct])
+    .select_from(GivenAnswer.__table__.join(PlayerInGame.__table__))
+    .where(
+        and_(
+            PlayerInGame.game_id == bindparam("game_id"),
+            GivenAnswer.is_correct.isnot(None),
+        )
+    )
+)
+
+# a grade written late does not apply to an answer unselected meanwhile
+grade_answer = (
+    update(GivenAnswer.__table__)
+    .where(
+        and_(
+            GivenAnswer.uuid == bindparam("answer_uuid"),
+            or_(
+                GivenAnswer.is_selected == Selected.true,
+                bindparam("correct", type_=Boolean).is_(None),
+            ),
+        )
+    )
+    .values(is_correct=bindparam("correct"))
+)
+
+# Export of a game, see export.py. Both are read in order of the answer,
+# so that the votes can be merged into the answers while streaming.
+export_answers = (
+    select(
+        [
+            GivenAnswer.id,
+            GivenAnswer.uuid.label("answer_uuid"),
+            GivenAnswer.answer,
+            GivenAnswer.is_selected,
+            GivenAnswer.is_correct,
+            GivenAnswer.time_created,
+            GivenAnswer.time_updated,
+            Question.uuid.label("question_uuid"),
+            Question.question,
+            Question.round,
+            PlayerInGame.id.label("player_id"),
+            Player.uuid.label("player_uuid"),
+            Player.name.label("player_name"),
+            Team.team_code,
+            Team.name.label("team_name"),
+        ]
+    )
+    .select_from(
+        GivenAnswer.__table__.join(PlayerInGame.__table__)
+        .join(Player.__table__)
+        .join(Question.__table__)
+        .outerjoin(Team.__table__, PlayerInGame.team_id == Team.id)
+    )
+    .where(PlayerInGame.game_id == bindparam("game_id"))
+    .order_by(GivenAnswer.id)
+)
+export_votes = (
+    select([Vote.answer_id, Vote.subplayer_id])
+    .select_from(Vote.__table__.join(PlayerInGame.__table__))
+    .where(PlayerInGame.game_id == bindparam("game_id"))
+    .order_by(Vote.answer_id, Vote.subplayer_id)
+)
+
+# publish or unpublish questions of a game, by uuid or a whole round
+activate_questions = (
+    update(Question.__table__)
+    .where(
+        and_(
+            Question.game_id == bindparam("game_id_"),
+            Question.uuid.in_(bindparam("question_uuids", expanding=True)),
+        )
+    )
+    .values(is_active=bindparam("active"))
+)
+activate_round = (
+    update(Question.__table__)
+    .where(
+        and_(
+            Question.game_id == bindparam("game_id_"),
+            Question.round == bindparam("round_"),
+        )
+    )
+    .values(is_active=bindparam("active"))
+)
+
+# the lobby, see lobby.py. Games from before is_archived are active.
+_lobby_columns = [Game.id, Game.uuid, Game.name, Game.num_questions]
+active_games = (
+    select(_lobby_columns).where(Game.is_archived.isnot(True)).order_by(Game.id)
+)
+archived_games = (
+    select(_lobby_columns).where(Game.is_archived.is_(True)).order_by(Game.id)
+)
+archive_game = (
+    update(Game.__table__)
+    .where(Game.id == bindparam("game_id_"))
+    .values(is_archived=bindparam("archived"))
+)
+
+move_player_to_team = (
+    update(PlayerInGame.__table__)
+    .where(PlayerInGame.id == bindparam("pig_id"))
+    .values(team_id=bindparam("team_id_"))
+)
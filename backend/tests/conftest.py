@@ -0,0 +1,206 @@
+"""Fixtures of the test suite.
+
+    cd backend && python -m pytest tests
+
+Every test that takes `database_url` runs on SQLite and, if
+QUIZ_TEST_DATABASE_URL points to a throwaway PostgreSQL database, on
+PostgreSQL as well. That database is wiped at the start of the run.
+
+Handler tests talk to a real server (quiz.py in a subprocess) over
+websockets, see `server` and `Client`.
+"""
+
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import uuid
+
+import pytest
+import websockets
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+from asyncdb import DBExecutor, DBSession  # noqa: E402
+from db import Game, Question, Team, create_db_engine  # noqa: E402
+from migrate import upgrade  # noqa: E402
+
+POSTGRES_URL = os.environ.get("QUIZ_TEST_DATABASE_URL")
+
+
+def run(coroutine):
+    return asyncio.get_event_loop().run_until_complete(coroutine)
+
+
+@pytest.fixture(scope="session", params=["sqlite", "postgresql"])
+def database_url(request, tmp_path_factory):
+    if request.param == "sqlite":
+        path = tmp_path_factory.mktemp("sqlite") / "quiz.db"
+        url = f"sqlite:///{path}"
+    else:
+        if not POSTGRES_URL:
+            pytest.skip("QUIZ_TEST_DATABASE_URL is not set")
+        url = POSTGRES_URL
+        engine = create_db_engine(url)
+        with engine.begin() as connection:
+            connection.execute(text("DROP SCHEMA public CASCADE"))
+            connection.execute(text("CREATE SCHEMA public"))
+        engine.dispose()
+    engine = create_db_engine(url)
+    upgrade(engine)
+    engine.dispose()
+    return url
+
+
+@pytest.fixture(scope="session")
+def engine(database_url):
+    engine = create_db_engine(database_url)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db(engine):
+    # a DBSession on the test database
+    executor = DBExecutor()
+    yield DBSession(sessionmaker(bind=engine), executor)
+    executor.shutdown()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture(scope="session")
+def server(database_url, tmp_path_factory):
+    # ws:// url of a server on the test database
+    port = free_port()
+    env = dict(
+        os.environ,
+        QUIZ_DATABASE_URL=database_url,
+        QUIZ_HOST="127.0.0.1",
+        QUIZ_PORT=str(port),
+        QUIZ_METRICS_PORT="",
+        QUIZ_LOG_LEVEL="WARNING",
+        QUIZ_RATE_LIMITS="off",
+    )
+    log = open(tmp_path_factory.mktemp("server") / "server.log", "w")
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(BACKEND, "quiz.py")],
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+    deadline = time.monotonic() + 15
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            break
+        except OSError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                pytest.fail("The server did not start, see " + log.name)
+            time.sleep(0.1)
+    yield f"ws://127.0.0.1:{port}/"
+    process.terminate()
+    process.wait()
+    log.close()
+    with open(log.name) as f:
+        assert "Traceback" not in f.read()
+
+
+@pytest.fixture
+def game(engine):
+    # A new game with two questions and an admin team "999"
+    session = sessionmaker(bind=engine)()
+    try:
+        game = Game(name="test", uuid=str(uuid.uuid4()))
+        questions = [
+            Question(question=f"Question {i}?", game=game, round=1) for i in range(2)
+        ]
+        session.add(game)
+        session.flush()
+        session.add(
+            Team(team_code="999", name="admins", game_id=game.id, quizadmin=True)
+        )
+        session.commit()
+        yield {
+            "uuid": str(game.uuid),
+            "id": game.id,
+            "questions": [str(q.uuid) for q in questions],
+        }
+    finally:
+        session.close()
+
+
+class Client:
+    """A player on the server, messages are read in the background."""
+
+    def __init__(self, url):
+        self.url = url
+        self.messages = []
+
+    async def connect(self, **init):
+        self.websocket = await websockets.connect(self.url + "?lobby=off")
+        self._reader = asyncio.ensure_future(self._read())
+        await self.send("init", **init)
+        await self.wait_for("player_id")
+        return self
+
+    async def _read(self):
+        try:
+            async for message in self.websocket:
+                if isinstance(message, bytes):
+                    message = message.decode()
+                self.messages.append(json.loads(message))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async def send(self, action, **data):
+        await self.websocket.send(json.dumps(dict(data, action=action)))
+
+    async def wait_for(self, msg_type, check=None, timeout=5.0):
+        # the payload of the first message of this type since the last wait
+        deadline = asyncio.get_event_loop().time() + timeout
+        while True:
+            for i, message in enumerate(self.messages):
+                if message["msg_type"] == msg_type and (
+                    check is None or check(message["payload"])
+                ):
+                    del self.messages[: i + 1]
+                    return message["payload"]
+            if asyncio.get_event_loop().time() > deadline:
+                raise AssertionError(f"No {msg_type} in {self.messages}")
+            await asyncio.sleep(0.02)
+
+    async def join(self, game_uuid, team_code):
+        await self.send("load_game", game_uuid=game_uuid)
+        await self.send("join_team", team_code=team_code)
+        return await self.wait_for("team_id", lambda p: p["team_code"] == team_code)
+
+    async def close(self):
+        await self.websocket.close()
+        await self._reader
+
+
+@pytest.fixture
+def connect(server):
+    # connect(**init) -> Client, closed after the test
+    clients = []
+
+    async def connect(**init):
+        client = await Client(server).connect(**init)
+        clients.append(client)
+        return client
+
+    yield connect
+    for client in clients:
+        run(client.close())
@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+
+from bus import Broker, UnixBus
+from conftest import run
+
+
+def test_events_reach_every_worker_in_order(tmp_path):
+    path = str(tmp_path / "bus.sock")
+
+    async def scenario():
+        broker = Broker(path)
+        await broker.start()
+        received = {0: [], 1: []}
+        buses = [UnixBus(path), UnixBus(path)]
+        for i, bus in enumerate(buses):
+            await bus.start(lambda event, seq, i=i: received[i].append((seq, event)))
+        await buses[0].publish({"n": 1})
+        await buses[1].publish({"n": 2})
+        await asyncio.sleep(0.1)
+        for bus in buses:
+            await bus.stop()
+        await broker.stop()
+        assert {bus.epoch for bus in buses} == {broker.epoch}
+        return received
+
+    received = run(scenario())
+    assert received[0] == received[1] == [(1, {"n": 1}), (2, {"n": 2})]
+
+
+def test_lost_broker(tmp_path):
+    path = str(tmp_path / "bus.sock")
+
+    async def scenario():
+        broker = Broker(path)
+        await broker.start()
+        bus = UnixBus(path)
+        lost = asyncio.Event()
+        bus.on_lost = lost.set
+        await bus.start(lambda event, seq: None)
+        await broker.stop()
+        for writer in broker._workers:
+            writer.close()
+        await asyncio.wait_for(lost.wait(), 1)
+        with pytest.raises(ConnectionError):
+            await bus.publish({"n": 1})
+        await bus.stop()
+
+    run(scenario())
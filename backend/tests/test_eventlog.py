@@ -0,0 +1,54 @@
+from eventlog import EventLog, game_stream, team_stream
+
+GAME = game_stream("G")
+TEAM = team_stream(1)
+
+
+def message(text):
+    return {"msg_type": "note", "payload": {"text": text}}
+
+
+def texts(events):
+    return [e.messages[0]["payload"]["text"] for e in events]
+
+
+def test_since_merges_the_streams_in_order():
+    log = EventLog()
+    log.append(GAME, [message("a")])
+    seq = log.append(TEAM, [message("b")])
+    log.append(team_stream(2), [message("other team")])
+    log.append(GAME, [message("c")])
+    log.append(TEAM, [message("d")], delta=message("d'"))
+    assert texts(log.since(log.epoch, 0, [GAME, TEAM])) == ["a", "b", "c", "d"]
+    events = log.since(log.epoch, seq, [GAME, TEAM])
+    assert texts(events) == ["c", "d"]
+    assert events[-1].for_client({"deltas"}) == [dict(message("d'"), seq=5)]
+
+
+def test_since_cannot_tell():
+    log = EventLog(size=2)
+    for text in "abc":
+        log.append(GAME, [message(text)])
+    assert log.since("other epoch", 3, [GAME]) is None
+    assert log.since(log.epoch, 4, [GAME]) is None
+    # "a" has rolled out of the buffer
+    assert log.since(log.epoch, 0, [GAME]) is None
+    assert texts(log.since(log.epoch, 1, [GAME])) == ["b", "c"]
+    assert log.since(log.epoch, 3, [GAME, TEAM]) == []
+
+
+def test_discarded_streams_are_not_resumed():
+    log = EventLog()
+    log.append(GAME, [message("a")])
+    log.discard(GAME)
+    assert log.since(log.epoch, 0, [GAME]) is None
+    assert log.since(log.epoch, 1, [GAME]) == []
+
+
+def test_since_checks_the_client_input():
+    log = EventLog()
+    log.append(GAME, [message("a")])
+    for seq in ["abc", None, -1, 1.5, True, [0]]:
+        assert log.since(log.epoch, seq, [GAME]) is None
+    assert log.since(None, 0, [GAME]) is None
+    assert log.since([log.epoch], 0, [GAME]) is None
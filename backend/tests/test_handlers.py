@@ -0,0 +1,213 @@
+import asyncio
+import time
+
+from sqlalchemy import select, text
+
+from db import GivenAnswer
+
+from conftest import run
+from writebehind import timestamp
+
+
+def poll(engine, query, expected, timeout=5.0, **params):
+    # the rows of `query` once they are `expected`, the writes are delayed
+    deadline = time.monotonic() + timeout
+    while True:
+        with engine.connect() as connection:
+            rows = [tuple(r) for r in connection.execute(text(query), **params)]
+        if rows == expected or time.monotonic() > deadline:
+            return rows
+        time.sleep(0.1)
+
+
+async def team(connect, game, team_code, size=2):
+    players = []
+    for _ in range(size):
+        player = await connect()
+        await player.join(game["uuid"], team_code)
+        players.append(player)
+    return players
+
+
+def test_update_answer(connect, game, engine):
+    async def scenario():
+        a, b = await team(connect, game, "t1")
+        question = game["questions"][0]
+        await a.send("update_answer", question_uuid=question, answer="Paris")
+        new = await b.wait_for("answer_changed")
+        assert new["answer"] == "Paris"
+        assert abs(new["timestamp"] / 1e6 - time.time()) < 60
+        await a.send("update_answer", question_uuid=question, answer="Rome")
+        edited = await b.wait_for("answer_changed")
+        assert edited["answer_uuid"] == new["answer_uuid"]
+        assert edited["answer"] == "Rome"
+        return new
+
+    new = run(scenario())
+    rows = poll(
+        engine,
+        "SELECT answer FROM given_answers WHERE player_id = :player_id",
+        [("Rome",)],
+        player_id=new["player_id"],
+    )
+    assert rows == [("Rome",)]
+    with engine.connect() as connection:
+        created = connection.execute(
+            select([GivenAnswer.time_created]).where(
+                GivenAnswer.player_id == new["player_id"]
+            )
+        ).scalar()
+    # the time the team was told is the one that was stored
+    assert timestamp(created) == new["timestamp"]
+
+
+def test_vote_and_select(connect, game):
+    async def scenario():
+        a, b = await team(connect, game, "t2")
+        question = game["questions"][0]
+        await a.send("update_answer", question_uuid=question, answer="A")
+        first = await b.wait_for("answer_changed")
+        await b.send("update_answer", question_uuid=question, answer="B")
+        second = await a.wait_for("answer_changed", lambda p: p["answer"] == "B")
+
+        await b.send("vote_answer", answer_uuid=first["answer_uuid"])
+        voted = await a.wait_for(
+            "answer_changed", lambda p: p["answer_uuid"] == first["answer_uuid"]
+        )
+        assert voted["votes"] == [second["player_id"]]
+
+        await a.send("select_answer", answer_uuid=first["answer_uuid"])
+        selected = await b.wait_for("answer_changed", lambda p: p["is_selected"])
+        assert selected["answer_uuid"] == first["answer_uuid"]
+
+        await a.send("select_answer", answer_uuid=second["answer_uuid"])
+        changed = {}
+        while len(changed) < 2:
+            payload = await b.wait_for("answer_changed")
+            changed[payload["answer_uuid"]] = payload["is_selected"]
+        assert changed == {first["answer_uuid"]: False, second["answer_uuid"]: True}
+
+    run(scenario())
+
+
+def test_grades_score(connect, game, engine):
+    async def scenario():
+        a, b = await team(connect, game, "t3")
+        (admin,) = await team(connect, game, "999", size=1)
+        question = game["questions"][1]
+        await a.send("update_answer", question_uuid=question, answer="42")
+        answer = await b.wait_for("answer_changed")
+        await a.send("select_answer", answer_uuid=answer["answer_uuid"])
+        await b.wait_for("answer_changed", lambda p: p["is_selected"])
+
+        await admin.send(
+            "grade_answer", answer_uuid=answer["answer_uuid"], correct=True
+        )
+        graded = await admin.wait_for("answer_graded")
+        assert graded == {"answer_uuid": answer["answer_uuid"], "correct": True}
+        await a.wait_for(
+            "leaderboard", lambda p: [t["score"] for t in p["teams"]] == [1]
+        )
+        return answer
+
+    answer = run(scenario())
+    rows = poll(
+        engine,
+        "SELECT is_correct FROM given_answers WHERE player_id = :player_id",
+        [(True,)],
+        player_id=answer["player_id"],
+    )
+    assert rows == [(True,)]
+
+
+def test_unselect_before_the_grade_is_written(connect, game, engine):
+    async def scenario():
+        a, b = await team(connect, game, "t4")
+        (admin,) = await team(connect, game, "999", size=1)
+        question = game["questions"][0]
+        await a.send("update_answer", question_uuid=question, answer="x")
+        first = await b.wait_for("answer_changed")
+        await b.send("update_answer", question_uuid=question, answer="y")
+        second = await a.wait_for("answer_changed", lambda p: p["answer"] == "y")
+
+        for unselect in (
+            ("unselect_answer", first["answer_uuid"]),
+            ("select_answer", second["answer_uuid"]),
+        ):
+            await a.send("select_answer", answer_uuid=first["answer_uuid"])
+            await b.wait_for(
+                "answer_changed",
+                lambda p: p["answer_uuid"] == first["answer_uuid"] and p["is_selected"],
+            )
+            await admin.send(
+                "grade_answer", answer_uuid=first["answer_uuid"], correct=True
+            )
+            await admin.wait_for("answer_graded")
+            # the grade is written a second later
+            action, answer_uuid = unselect
+            await a.send(action, answer_uuid=answer_uuid)
+            await b.wait_for(
+                "answer_changed",
+                lambda p: p["answer_uuid"] == first["answer_uuid"]
+                and not p["is_selected"],
+            )
+            scores = await a.wait_for(
+                "leaderboard",
+                lambda p: [t["score"] for t in p["teams"]] == [0],
+            )
+            assert scores["teams"][0]["team_code"] == "t4"
+        await asyncio.sleep(1.5)
+        return first
+
+    first = run(scenario())
+    with engine.connect() as connection:
+        correct = connection.execute(
+            select([GivenAnswer.is_correct]).where(
+                GivenAnswer.player_id == first["player_id"]
+            )
+        ).scalar()
+    assert correct is None
+
+
+def test_invalid_frames_are_skipped(connect, game):
+    async def scenario():
+        player = await connect()
+        for frame in ["garbage", "[1]", '{"answer": 1}', '{"action": ["init"]}']:
+            await player.websocket.send(frame)
+        await player.send("no_such_action")
+        await player.join(game["uuid"], "t5")
+
+    run(scenario())
+
+
+def test_publish_round(connect, game):
+    async def scenario():
+        (player,) = await team(connect, game, "t6", size=1)
+        (admin,) = await team(connect, game, "999", size=1)
+        await admin.send("publish_questions", round="x")
+        await admin.send("publish_questions", round=[1])
+        await admin.send("publish_questions", round="1")
+        published = set()
+        while len(published) < 2:
+            payload = await player.wait_for("update_question")
+            assert payload["is_active"]
+            published.add(payload["question_uuid"])
+        assert published == set(game["questions"])
+
+    run(scenario())
+
+
+def test_resume_with_invalid_position(connect, game):
+    async def scenario():
+        player = await connect(capabilities=["game_snapshot"])
+        await player.send("load_game", game_uuid=game["uuid"])
+        epoch = (await player.wait_for("game_snapshot"))["epoch"]
+        await player.send("resume", game_uuid=game["uuid"], epoch=epoch, seq=0)
+        await player.wait_for("resumed")
+        for seq in ["abc", -1, None, [1]]:
+            await player.send("resume", game_uuid=game["uuid"], epoch=epoch, seq=seq)
+            # the whole state instead of the missed events
+            snapshot = await player.wait_for("game_snapshot")
+            assert snapshot["game"]["game_uuid"] == game["uuid"]
+
+    run(scenario())
@@ -0,0 +1,100 @@
+import asyncio
+import math
+from types import SimpleNamespace
+
+import inbound
+from conftest import run
+from inbound import Inbox, RateLimiter, TokenBucket, parse_limits
+
+
+class Clock:
+    # the time of the rate limits, not of the event loop
+    def __init__(self, monkeypatch):
+        self.now = 1000.0
+        monkeypatch.setattr(inbound, "time", SimpleNamespace(monotonic=self.time))
+
+    def time(self):
+        return self.now
+
+
+def test_parse_limits():
+    assert parse_limits("*=50/100, update_answer=30") == {
+        "*": (50.0, 100.0),
+        "update_answer": (30.0, 30.0),
+    }
+    assert parse_limits("") == {}
+
+
+def test_token_bucket_refills(monkeypatch):
+    clock = Clock(monkeypatch)
+    bucket = TokenBucket(2, 2)
+    bucket.tokens -= 2
+    assert bucket.wait(clock.now) == 0.5
+    assert bucket.wait(clock.now + 0.5) == 0
+    assert TokenBucket(0, 0).wait(clock.now) == math.inf
+
+
+def test_rate_limiter_budgets(monkeypatch):
+    clock = Clock(monkeypatch)
+    limiter = RateLimiter({"*": (1, 2), "vote_answer": (1, 1)})
+    assert limiter.allow_frame()
+    assert limiter.allow_frame()
+    assert not limiter.allow_frame()
+    # the actions have budgets of their own
+    assert limiter.allow("vote_answer")
+    assert not limiter.allow("vote_answer")
+    assert limiter.allow("other")
+    clock.now += 1
+    assert limiter.allow_frame()
+    assert limiter.allow("vote_answer")
+
+
+def test_inbox_coalesces_waiting_messages():
+    inbox = Inbox(10)
+    assert inbox.put("update_answer", {"question_uuid": "q", "answer": "a"}) is None
+    assert inbox.put("vote_answer", {"answer_uuid": "x"}) is None
+    assert inbox.put("update_answer", {"question_uuid": "q", "answer": "ab"}) == (
+        "coalesced"
+    )
+    assert inbox.put("unvote_answer", {"answer_uuid": "x"}) == "coalesced"
+    assert len(inbox) == 2
+    assert run(inbox.get()) == ("update_answer", {"question_uuid": "q", "answer": "ab"})
+    assert run(inbox.get()) == ("unvote_answer", {"answer_uuid": "x"})
+
+
+def test_inbox_drops_over_budget_and_when_full(monkeypatch):
+    Clock(monkeypatch)
+    inbox = Inbox(2, RateLimiter({"*": (1, 10), "join_team": (1, 1)}))
+    assert inbox.put("join_team", {}) is None
+    assert inbox.put("join_team", {}) == "rate_limited"
+    assert inbox.put("set_team_name", {}) is None
+    assert inbox.put("set_team_name", {}) == "overflow"
+
+
+def test_inbox_holds_back_coalesced_messages(monkeypatch):
+    clock = Clock(monkeypatch)
+    inbox = Inbox(10, RateLimiter({"update_answer": (1, 1)}))
+
+    async def scenario():
+        inbox.put("update_answer", {"question_uuid": "q", "answer": "a"})
+        assert await inbox.get() == (
+            "update_answer",
+            {"question_uuid": "q", "answer": "a"},
+        )
+        inbox.put("update_answer", {"question_uuid": "q", "answer": "ab"})
+        waiting = asyncio.ensure_future(inbox.get())
+        await asyncio.sleep(0.01)
+        assert not waiting.done()
+        # still replaced while it waits for its budget
+        inbox.put("update_answer", {"question_uuid": "q", "answer": "abc"})
+        clock.now += 1
+        inbox._wakeup.set()
+        return await asyncio.wait_for(waiting, 1)
+
+    assert run(scenario()) == ("update_answer", {"question_uuid": "q", "answer": "abc"})
+
+
+def test_closed_inbox_returns_none():
+    inbox = Inbox(10)
+    inbox.close()
+    assert run(inbox.get()) is None
@@ -0,0 +1,44 @@
+import asyncio
+import uuid
+
+from sqlalchemy.orm import sessionmaker
+
+from asyncdb import DBExecutor
+from conftest import run
+from db import Game
+from lobby import Lobby
+
+
+def add_game(engine):
+    session = sessionmaker(bind=engine)()
+    try:
+        game = Game(name="lobby", uuid=str(uuid.uuid4()))
+        session.add(game)
+        session.commit()
+        return str(game.uuid)
+    finally:
+        session.close()
+
+
+def test_games_created_elsewhere_show_up(engine):
+    executor = DBExecutor()
+    lobby = Lobby(sessionmaker(bind=engine), executor, ttl=0.2)
+
+    async def uuids():
+        return {g["game_uuid"] for g in await lobby.games()}
+
+    async def scenario():
+        first = add_game(engine)
+        assert first in await uuids()
+        second = add_game(engine)
+        assert second not in await uuids()
+        await asyncio.sleep(0.2)
+        assert second in await uuids()
+        third = add_game(engine)
+        lobby.invalidate()
+        assert third in await uuids()
+
+    try:
+        run(scenario())
+    finally:
+        executor.shutdown()
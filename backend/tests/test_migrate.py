@@ -0,0 +1,59 @@
+from sqlalchemy import MetaData, Table, inspect
+
+from db import Base, create_db_engine
+from migrate import MIGRATIONS, is_current, set_version, upgrade
+
+# columns added by the migrations, (table, column)
+ADDED = {
+    ("questions", "round"),
+    ("given_answers", "is_correct"),
+    ("games", "is_archived"),
+}
+
+
+def create_old_schema(engine):
+    # The tables as they were before the first migration, without the
+    # added columns and indexes
+    old = MetaData()
+    for table in Base.metadata.sorted_tables:
+        columns = [c.copy() for c in table.columns if (table.name, c.name) not in ADDED]
+        Table(table.name, old, *columns)
+    old.create_all(engine)
+
+
+def test_new_database_is_current(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'quiz.db'}")
+    assert not is_current(engine)
+    assert upgrade(engine) == []
+    assert is_current(engine)
+
+
+def test_upgrade_old_database(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'quiz.db'}")
+    create_old_schema(engine)
+    assert upgrade(engine, dry_run=True) == MIGRATIONS
+    assert not is_current(engine)
+
+    assert upgrade(engine) == MIGRATIONS
+    inspector = inspect(engine)
+    for table, column in ADDED:
+        assert column in {c["name"] for c in inspector.get_columns(table)}
+    for table in Base.metadata.sorted_tables:
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        assert {index.name for index in table.indexes} <= existing
+    assert is_current(engine)
+    assert upgrade(engine) == []
+
+
+def test_upgrade_drops_the_duplicate_index(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'quiz.db'}")
+    upgrade(engine)
+    with engine.begin() as connection:
+        connection.execute(
+            "CREATE INDEX ix_given_answers_question_player "
+            "ON given_answers (question_uuid, player_id)"
+        )
+        set_version(connection, 4)
+    assert upgrade(engine) == MIGRATIONS[4:]
+    indexes = {i["name"] for i in inspect(engine).get_indexes("given_answers")}
+    assert "ix_given_answers_question_player" not in indexes
@@ -0,0 +1,114 @@
+import asyncio
+
+from codec import JSON
+from conftest import run
+from outbound import COALESCE, DISCONNECT, DROP, Frame, SendQueue
+
+
+class Socket:
+    def __init__(self):
+        self.sent = []
+        self.closed = None
+
+    async def send(self, data):
+        self.sent.append(data)
+
+    async def close(self, code, reason):
+        self.closed = code
+
+
+def answer(answer_uuid, text):
+    payload = {"answer_uuid": answer_uuid, "answer": text}
+    return Frame({"msg_type": "answer_changed", "payload": payload})
+
+
+def note(text):
+    return Frame({"msg_type": "note", "payload": {"text": text}})
+
+
+def payloads(queue):
+    return [JSON.decode(data)["payload"] for _, data in queue._frames]
+
+
+def test_compacts_only_when_full():
+    queue = SendQueue(Socket(), maxsize=3, policy=COALESCE)
+    assert queue.put(answer("a", "1"))
+    assert queue.put(answer("a", "2"))
+    assert queue.put(note("x"))
+    assert queue.coalesced == 0
+    assert queue.put(answer("a", "3"))
+    # the older frames of "a" made room, the others keep their order
+    assert payloads(queue) == [{"text": "x"}, {"answer_uuid": "a", "answer": "3"}]
+    assert queue.coalesced == 2
+
+
+def test_coalesce_closes_when_nothing_is_obsolete():
+    socket = Socket()
+
+    async def scenario():
+        queue = SendQueue(socket, maxsize=2, policy=COALESCE)
+        queue.put(note("1"))
+        queue.put(note("2"))
+        assert not queue.put(note("3"))
+        await asyncio.sleep(0)
+        return queue
+
+    queue = run(scenario())
+    assert queue.closed
+    assert socket.closed == 1008
+
+
+def test_drop_keeps_the_queue():
+    queue = SendQueue(Socket(), maxsize=1, policy=DROP)
+    assert queue.put(note("1"))
+    assert not queue.put(note("2"))
+    assert queue.dropped == 1
+    assert not queue.closed
+
+
+def test_disconnect_closes():
+    socket = Socket()
+
+    async def scenario():
+        queue = SendQueue(socket, maxsize=1, policy=DISCONNECT)
+        queue.put(answer("a", "1"))
+        queue.put(answer("a", "2"))
+        await asyncio.sleep(0)
+        return queue
+
+    assert run(scenario()).closed
+    assert socket.closed == 1008
+
+
+def test_writer_sends_in_order():
+    socket = Socket()
+
+    async def scenario():
+        queue = SendQueue(socket, maxsize=10)
+        queue.start()
+        for i in range(3):
+            queue.put(note(str(i)))
+        await queue.wait_below(1)
+        queue.stop()
+
+    run(scenario())
+    assert [JSON.decode(data)["payload"]["text"] for data in socket.sent] == [
+        "0",
+        "1",
+        "2",
+    ]
+
+
+def test_wait_below_an_empty_queue():
+    socket = Socket()
+
+    async def scenario():
+        queue = SendQueue(socket, maxsize=1)
+        queue.start()
+        queue.put(note("0"))
+        # maxsize // 2 of a queue of one
+        await asyncio.wait_for(queue.wait_below(0), 1)
+        queue.stop()
+
+    run(scenario())
+    assert len(socket.sent) == 1
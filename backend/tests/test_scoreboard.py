@@ -0,0 +1,75 @@
+from sqlalchemy.orm import sessionmaker
+
+from conftest import run
+from db import GivenAnswer, Player, PlayerInGame, Selected, Team
+from scoreboard import Scoreboard
+
+
+def add_answers(engine, game, grades):
+    # A team with an answer per grade, (is_selected, is_correct) each.
+    # Returns the team id and the answer uuids.
+    session = sessionmaker(bind=engine)()
+    try:
+        team = Team(team_code="t", name="t", game_id=game["id"])
+        player = Player(name="p", color="red")
+        session.add_all([team, player])
+        session.flush()
+        sub_player = PlayerInGame(
+            player_id=player.id, game_id=game["id"], team_id=team.id
+        )
+        session.add(sub_player)
+        session.flush()
+        answers = [
+            GivenAnswer(
+                answer=str(i),
+                question_uuid=game["questions"][i],
+                player_id=sub_player.id,
+                is_selected=Selected.true if selected else None,
+                is_correct=correct,
+            )
+            for i, (selected, correct) in enumerate(grades)
+        ]
+        session.add_all(answers)
+        session.commit()
+        return team.id, [str(a.uuid) for a in answers]
+    finally:
+        session.close()
+
+
+def test_load_and_apply(db, engine, game):
+    team_id, (right, wrong) = add_answers(engine, game, [(True, True), (True, False)])
+    scoreboard = Scoreboard(db)
+    changed = []
+    scoreboard.on_change = changed.append
+
+    async def scenario():
+        assert scoreboard.scores(game["uuid"]) is None
+        assert await scoreboard.load(db, game["uuid"], game["id"]) == {team_id: 1}
+        assert scoreboard.grade(game["uuid"], wrong) is False
+        scoreboard.apply(game["uuid"], wrong, team_id, True)
+        assert scoreboard.scores(game["uuid"]) == {team_id: 2}
+        scoreboard.apply(game["uuid"], right, team_id, None)
+        scoreboard.apply(game["uuid"], wrong, team_id, None)
+        assert scoreboard.scores(game["uuid"]) == {team_id: 0}
+
+    run(scenario())
+    # the later changes wait for the interval
+    assert changed == [game["uuid"]]
+
+
+def test_flush_writes_grades_of_selected_answers(db, engine, game):
+    team_id, (selected, unselected) = add_answers(
+        engine, game, [(True, None), (False, None)]
+    )
+    scoreboard = Scoreboard(db, delay=0.01)
+
+    async def scenario():
+        scoreboard.record(selected, True)
+        scoreboard.record(unselected, True)
+        assert len(scoreboard) == 2
+        await scoreboard._task
+        assert len(scoreboard) == 0
+        return await Scoreboard(db).load(db, game["uuid"], game["id"])
+
+    # the grade of the unselected answer is not stored
+    assert run(scenario()) == {team_id: 1}
@@ -0,0 +1,47 @@
+from conftest import run
+from writebehind import AnswerWriter
+
+
+class Database:
+    # runs find_answer, the writes are only recorded
+    def __init__(self):
+        self.written = []
+
+    async def run(self, fn, *args):
+        if fn.__name__ == "write_answers":
+            self.written.append([w.text for w in args[0]])
+            return None
+        return fn(None, *args)
+
+
+def no_answer(session, question_uuid, player_id):
+    return {}
+
+
+QUESTIONS = [f"00000000-0000-0000-0000-00000000000{i}" for i in range(4)]
+
+
+def test_stored_answers_are_kept():
+    db = Database()
+    writer = AnswerWriter(db, no_answer, delay=0.01, max_answers=2)
+
+    async def scenario():
+        first, _ = await writer.update(db, 1, 1, QUESTIONS[0], "a")
+        await writer.update(db, 1, 1, QUESTIONS[0], "ab")
+        await writer.flush()
+        assert db.written == [["a"], ["ab"]]
+        assert writer.payload(first["answer_uuid"])["answer"] == "ab"
+
+        second, _ = await writer.update(db, 1, 1, QUESTIONS[1], "b")
+        await writer.update(db, 1, 1, QUESTIONS[1], "bc")
+        writer.payload(first["answer_uuid"])
+        # the least recently used stored answer goes, not the pending one
+        third, _ = await writer.update(db, 1, 1, QUESTIONS[2], "c")
+        fourth, _ = await writer.update(db, 1, 1, QUESTIONS[3], "d")
+        assert writer.payload(first["answer_uuid"]) is None
+        assert writer.payload(third["answer_uuid"]) is None
+        assert writer.payload(second["answer_uuid"])["answer"] == "bc"
+        assert writer.payload(fourth["answer_uuid"])["answer"] == "d"
+        await writer.flush()
+
+    run(scenario())
@@ -0,0 +1,294 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Tuple
+from uuid import uuid4
+
+from cache import as_uuid
+import statements
+from db import GivenAnswer
+from statements import execute
+
+LOG = logging.getLogger("quiz.writebehind")
+
+
+def timestamp(dt: datetime) -> int:
+    # SQLite returns naive datetimes, they are in UTC like CURRENT_TIMESTAMP
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000_000)
+
+
+class PendingWrite:
+    __slots__ = (
+        "answer_uuid",
+        "question_uuid",
+        "player_id",
+        "game_id",
+        "text",
+        "is_new",
+        "time_created",
+        "first_edit",
+        "last_edit",
+        "attempts",
+    )
+
+    def __init__(self, answer_uuid, question_uuid, player_id, game_id, text, now):
+        self.answer_uuid = answer_uuid
+        self.question_uuid = question_uuid
+        self.player_id = player_id
+        self.game_id = game_id
+        self.text = text
+        self.is_new = False
+        self.time_created = None
+        self.first_edit = now
+        self.last_edit = now
+        self.attempts = 0
+
+
+def write_answers(session, writes):
+    # Store a batch of answer edits in a single transaction
+    for w in writes:
+        if w.is_new:
+            session.add(
+                GivenAnswer(
+                    uuid=w.answer_uuid,
+                    question_uuid=w.question_uuid,
+                    player_id=w.player_id,
+                    answer=w.text,
+                    time_created=w.time_created,
+                )
+            )
+    session.flush()
+    # all edits of existing answers in one executemany
+    edits = [
+        {"answer_uuid": w.answer_uuid, "text": w.text} for w in writes if not w.is_new
+    ]
+    if edits:
+        execute(session, statements.update_answer_text, edits)
+    session.commit()
+
+
+class AnswerWriter:
+    """Write-behind buffer for `update_answer`.
+
+    Edits are answered from memory right away and the last known payload
+    of every answer is kept, so the team sees every keystroke. A new answer
+    is inserted before anyone hears of it, so that other workers can vote
+    for or select it. Only later edits of the text are buffered: the
+    database gets them once the player pauses for `delay` seconds (or at
+    least every `max_delay` seconds while typing on), with all due answers
+    written in one transaction.
+
+    `find_answer(session, question_uuid, player_id)` looks up an answer
+    that is not known yet. It returns its payload, {} if the player has
+    not answered yet and None if the question does not exist.
+
+    Anything that reads or changes an answer in the database must call
+    `flush_answer`/`flush` first.
+
+    Votes and the selection of the remembered answers are kept in memory
+    as well (`add_vote`, `remove_vote`, `set_selected`), after they have
+    been stored. Other workers keep them current through `remember`. Of
+    the stored answers the `max_answers` used most recently are kept, the
+    others are read again when needed.
+    """
+
+    MAX_ATTEMPTS = 3
+
+    def __init__(self, db, find_answer, delay=0.75, max_delay=5.0, max_answers=10000):
+        # db is the DBSession the writes run in
+        self.db = db
+        self.find_answer = find_answer
+        self.delay = delay
+        self.max_delay = max_delay
+        self.max_answers = max_answers
+        self._lock = asyncio.Lock()
+        self._task = None
+        # answer_uuid -> latest payload
+        self._payloads: Dict[str, dict] = {}
+        # the remembered answers, least recently used first
+        self._recent: "OrderedDict[str, None]" = OrderedDict()
+        # (player_id, question_uuid) -> answer_uuid
+        self._by_key: Dict[Tuple[int, str], str] = {}
+        # answer_uuid -> PendingWrite
+        self._pending: Dict[str, PendingWrite] = {}
+
+    def __len__(self):
+        return len(self._pending)
+
+    def remember(self, payload):
+        # Keep the latest payload of an answer that came from the database
+        # or from another worker
+        answer_uuid = payload["answer_uuid"]
+        pending = self._pending.get(answer_uuid)
+        if pending is not None:
+            payload = dict(payload, answer=pending.text)
+        self._payloads[answer_uuid] = payload
+        self._by_key[(payload["player_id"], payload["question_uuid"])] = answer_uuid
+        self._recent[answer_uuid] = None
+        self._used(answer_uuid)
+        self._evict()
+
+    def _used(self, answer_uuid):
+        if answer_uuid in self._recent:
+            self._recent.move_to_end(answer_uuid)
+
+    def _evict(self):
+        # the least recently used answers, except for those with edits that
+        # are not stored yet
+        excess = len(self._recent) - self.max_answers
+        if excess <= 0:
+            return
+        evicted = []
+        for answer_uuid in self._recent:
+            if len(evicted) == excess:
+                break
+            if answer_uuid not in self._pending:
+                evicted.append(answer_uuid)
+        for answer_uuid in evicted:
+            self._forget(answer_uuid)
+
+    def _forget(self, answer_uuid):
+        payload = self._payloads.pop(answer_uuid, None)
+        if payload is not None:
+            key = (payload["player_id"], payload["question_uuid"])
+            if self._by_key.get(key) == answer_uuid:
+                del self._by_key[key]
+        self._recent.pop(answer_uuid, None)
+
+    def loaded(self, payload):
+        # Like `remember` for a payload read from the database, whose text
+        # may be older than the one heard from the team
+        known = self._payloads.get(payload["answer_uuid"])
+        if known is not None:
+            payload = dict(payload, answer=known["answer"])
+        self.remember(payload)
+        return payload
+
+    def payload(self, answer_uuid):
+        answer_uuid = str(as_uuid(answer_uuid))
+        self._used(answer_uuid)
+        return self._payloads.get(answer_uuid)
+
+    def add_vote(self, answer_uuid, sub_player_id):
+        payload = self.payload(answer_uuid)
+        if payload is not None and sub_player_id not in payload["votes"]:
+            payload["votes"].append(sub_player_id)
+        return payload
+
+    def remove_vote(self, answer_uuid, sub_player_id):
+        payload = self.payload(answer_uuid)
+        if payload is not None and sub_player_id in payload["votes"]:
+            payload["votes"].remove(sub_player_id)
+        return payload
+
+    def set_selected(self, answer_uuid, is_selected):
+        payload = self.payload(answer_uuid)
+        if payload is not None:
+            payload["is_selected"] = is_selected
+        return payload
+
+    async def update(self, db, game_id, sub_player_id, question_uuid, text):
+        # Returns the new answer payload, or None if there is no such
+        # question, and whether the answer has just been created
+        question_uuid = str(as_uuid(question_uuid))
+        key = (sub_player_id, question_uuid)
+        is_new = False
+        if key not in self._by_key:
+            payload = await db.run(self.find_answer, question_uuid, sub_player_id)
+            if payload is None:
+                return None, False
+            if key not in self._by_key:
+                if not payload:
+                    is_new = True
+                    created = datetime.now(timezone.utc)
+                    payload = {
+                        "answer": text,
+                        "question_uuid": question_uuid,
+                        "answer_uuid": str(uuid4()),
+                        "player_id": sub_player_id,
+                        "votes": [],
+                        "is_selected": False,
+                        "timestamp": timestamp(created),
+                    }
+                self.remember(payload)
+
+        answer_uuid = self._by_key[key]
+        payload = dict(self._payloads[answer_uuid], answer=text)
+        self._payloads[answer_uuid] = payload
+        self._used(answer_uuid)
+
+        now = asyncio.get_event_loop().time()
+        pending = self._pending.get(answer_uuid)
+        if pending is None:
+            pending = PendingWrite(
+                answer_uuid, question_uuid, sub_player_id, game_id, text, now
+            )
+            self._pending[answer_uuid] = pending
+            if is_new:
+                pending.is_new = True
+                pending.time_created = created
+        pending.text = text
+        pending.last_edit = now
+
+        if is_new:
+            # the team hears of the answer only once it is stored
+            await self._write([answer_uuid])
+        if self._pending and (self._task is None or self._task.done()):
+            self._task = asyncio.ensure_future(self._flush_paused())
+        return payload, is_new
+
+    async def _flush_paused(self):
+        while self._pending:
+            await asyncio.sleep(self.delay / 2)
+            now = asyncio.get_event_loop().time()
+            due = [
+                w.answer_uuid
+                for w in self._pending.values()
+                if now - w.last_edit >= self.delay
+                or now - w.first_edit >= self.max_delay
+            ]
+            if due:
+                await self._write(due)
+
+    async def _write(self, answer_uuids):
+        writes = [self._pending.pop(u) for u in answer_uuids if u in self._pending]
+        async with self._lock:
+            if not writes:
+                return
+            try:
+                await self.db.run(write_answers, writes)
+            except Exception:
+                LOG.exception("Could not store %d answers", len(writes))
+                self._requeue(writes)
+
+    def _requeue(self, writes):
+        for w in writes:
+            w.attempts += 1
+            if w.attempts >= self.MAX_ATTEMPTS:
+                LOG.error("Giving up on answer %s.", w.answer_uuid)
+                if w.answer_uuid not in self._pending:
+                    self._forget(w.answer_uuid)
+                continue
+            newer = self._pending.get(w.answer_uuid)
+            if newer is None:
+                self._pending[w.answer_uuid] = w
+            elif w.is_new:
+                newer.is_new = True
+                newer.time_created = w.time_created
+
+    async def flush_answer(self, answer_uuid):
+        answer_uuid = str(as_uuid(answer_uuid))
+        # also waits for a write of this answer that is already under way
+        await self._write([answer_uuid])
+
+    async def flush(self, game_id=None):
+        await self._write(
+            [
+                w.answer_uuid
+                for w in self._pending.values()
+                if game_id is None or w.game_id == game_id
+            ]
+        )